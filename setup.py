@@ -87,5 +87,8 @@ setup(
     setup_requires=[
     ],
     entry_points={
+        'console_scripts': [
+            'trezor-shim = trezor_shim.cli:main',
+        ],
     },
 )
@@ -1,4 +1,11 @@
-from trezor_shim.core import keeping
+def __getattr__(name):
+    """Import submodules on first access, keeping `import trezor_shim` cheap."""
+    if name == 'keeping':
+        from trezor_shim.core import keeping
+        return keeping
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
 
 def module():
-    return keeping.Module()
\ No newline at end of file
+    from trezor_shim.core import keeping
+    return keeping.Module()
@@ -0,0 +1,24 @@
+"""Command line entry point: `trezor-shim serve` and `trezor-shim agent`."""
+import argparse
+
+
+def main():
+    """Run the selected command."""
+    from trezor_shim.core import serving
+    from trezor_shim.trezor import agent
+
+    p = argparse.ArgumentParser(prog='trezor-shim')
+    commands = p.add_subparsers(dest='command', required=True)
+    serve = commands.add_parser('serve', help='sign for other processes, keeping the device open')
+    serving.add_arguments(serve)
+    serve.set_defaults(run=serving.run)
+    passphrases = commands.add_parser('agent', help='hold passphrases for other processes')
+    agent.add_arguments(passphrases)
+    passphrases.set_defaults(run=agent.run)
+
+    args = p.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
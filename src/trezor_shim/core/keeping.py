@@ -4,23 +4,163 @@ SIGNIFYPY
 trezor-shim module
 
 """
+import base64
+import copy
+import logging
+import threading
+from concurrent import futures
+
 from keri.core import coring
-from keri.core.coring import MtrDex, Cigar, IdrDex, Siger
+from keri.core.coring import MtrDex, Cigar, IdrDex, Indexer, Siger, intToB64
+from ..trezor import formats
+from ..trezor import interface
+from ..trezor import metrics
 from ..trezor import trezor
 
+from ..trezor import actors
+from ..trezor import caching
+from ..trezor import emulator
+from ..trezor import pool
+from ..trezor import sessions
 from ..trezor import util
 from ..trezor import ui
 
+log = logging.getLogger(__name__)
+
+# Device implementations selectable with TrezorShim(backend=...)
+BACKENDS = {
+    'trezor': trezor.Trezor,
+    'emulator': emulator.SoftTrezor,
+}
+
+SIG_SIZE = 64  # raw Ed25519 signature
+
 class Module:
 
     def shim(self, **kwargs):
+        if kwargs.get('daemon'):  # talk to a `trezor-shim serve` daemon owning the device
+            from . import serving
+            return serving.ProxyShim(**kwargs)
         return TrezorShim( **kwargs)
 
+    def async_shim(self, **kwargs):
+        return AsyncTrezorShim( **kwargs)
+
+class KeyCache:
+    """
+    Bounded LRU of verification keys derived by one device seed.
+
+    Entries are keyed by (stem, pidx, kidx, curve) and hold the raw verkey
+    plus the Verfer objects built from it. The cache is bound to a device
+    seed fingerprint and is emptied whenever a different seed shows up.
+    """
+
+    def __init__(self, size=1024):
+        """C-tor."""
+        self.size = size
+        self.fingerprint = None
+        self.lock = threading.Lock()
+        self.entries = caching.LRUCache(size=size, metric='trezor_shim_key_cache_total')
+
+    def bind(self, fingerprint):
+        """Bind the cache to a device seed, dropping keys of any other seed."""
+        with self.lock:
+            if fingerprint != self.fingerprint:
+                self.entries.clear()
+                self.fingerprint = fingerprint
+
+    def get(self, key):
+        """Return the raw verkey for `key`, or None if not cached."""
+        entry = self.entries.get(key)
+        return None if entry is None else entry[0]
+
+    def put(self, key, verkey, code=None):
+        """
+        Store the raw verkey for `key`, evicting the least recently used.
+
+        Returns a Verfer with derivation `code` for the key, if `code` is given.
+        """
+        return self._verfer(self.entries.put(key, (bytes(verkey), {})), code)
+
+    def load(self, key, code, loader):
+        """Return a Verfer with derivation `code` for `key`, calling `loader()` for its verkey once."""
+        return self._verfer(self.entries.load(key, lambda: (bytes(loader()), {})), code)
+
+    def peek(self, key, code):
+        """Return a Verfer with derivation `code` for `key`, or None, without counting a lookup."""
+        return self._verfer(self.entries.peek(key), code)
+
+    def verfer(self, key, code):
+        """Return a Verfer with derivation `code` for `key`, or None if not cached."""
+        return self._verfer(self.entries.get(key), code)
+
+    def stats(self):
+        """Return the lookups and evictions counted so far."""
+        return self.entries.stats()
+
+    @staticmethod
+    def _verfer(entry, code):
+        if entry is None or code is None:
+            return None
+        verkey, verfers = entry
+        if code not in verfers:
+            verfers[code] = coring.Verfer(raw=verkey, code=code)
+        return verfers[code]
+
+
+class Verifier:
+    """
+    Host-side check of device signatures against the cached verification keys.
+
+    Signatures are verified on a thread pool as soon as the device returns
+    them, overlapping with the next device exchange; callers wait for the
+    checks of a whole signature set or batch at once.
+    """
+
+    def __init__(self, workers=2):
+        """C-tor."""
+        self.workers = workers
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def submit(self, ser, sig, verfer, key_id):
+        """Queue the check of signature `sig` of `ser` by `key_id`, returning its future."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='trezor-shim-verify')
+            return self.executor.submit(self._verify, ser, sig, verfer, key_id)
+
+    @staticmethod
+    def wait(checks):
+        """Wait for `checks`, raising DeviceError if a signature does not verify."""
+        for check in checks:
+            check.result()
+
+    def close(self):
+        """Stop the thread pool, until the next check."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    @staticmethod
+    def _verify(ser, sig, verfer, key_id):
+        with metrics.timer('trezor_shim_verify_seconds'):
+            verified = verfer.verify(sig, ser)
+        if not verified:
+            metrics.inc('trezor_shim_verify_failures_total')
+            raise interface.DeviceError(f"signature by {key_id} does not verify "
+                                        f"with key {verfer.qb64}")
+
+
 class TrezorShim:
     STEM = 'trezor_shim'
 
     def __init__(self, pidx, kidx=0, transferable=True, stem=None, count=1, ncount=1,
-                 dcode=MtrDex.Blake3_256):
+                 dcode=MtrDex.Blake3_256, idle_timeout=0.0, cache_size=1024, pooled=False,
+                 threaded=False, backend='trezor', prefetch=0, verify=False, keepalive=None,
+                 **options):
 
         self.icount = count
         self.ncount = ncount
@@ -30,9 +170,63 @@ class TrezorShim:
         self.transferable = transferable
         self.stem = stem if stem is not None else self.STEM
 
-        self.device = trezor.Trezor()
-        self.device.ui = ui.UI(trezor.Trezor, config=None)
-        self.device.ui.cached_passphrase_ack = util.ExpiringCache(seconds=float(60))
+        self.shared = False  # owns one hold on a process-wide DeviceActor
+        self.backend = BACKENDS[backend]
+        self.options = options  # passed on to the backend, e.g. the emulator's mnemonic
+        self.ui = ui.UI(trezor.Trezor, config=None)
+        self.ui.cached_passphrase_ack = util.ExpiringCache(seconds=float(60))
+        if keepalive:
+            idle_timeout = float('inf')  # the keepalive decides when the device is gone
+        if pooled:  # every connected device restored from the same seed
+            self.session = pool.Pool.discover(self._device, idle_timeout=idle_timeout,
+                                              threaded=threaded)
+            self.device = self.session.members[0].device
+        elif threaded:  # one worker thread owns the device, shared by every shim in the process
+            key = (backend, None, frozenset(options.items()))
+            self.session = actors.DeviceActor.shared(key, lambda: sessions.Session(
+                self._device(), idle_timeout=idle_timeout))
+            if self.session.session.idle_timeout != float(idle_timeout):
+                raise ValueError('{} is shared with an idle_timeout of {}, not {}'.format(
+                    self.session.device, self.session.session.idle_timeout, idle_timeout))
+            self.device = self.session.device
+            self.shared = True
+        else:
+            # one connection per operation by default, or kept warm for `idle_timeout` seconds
+            self.device = self._device()
+            self.session = sessions.Session(self.device, idle_timeout=idle_timeout)
+        self.cache = KeyCache(size=cache_size)
+        # next keys of the following `prefetch` rotations, derived in the background
+        self.prefetch = prefetch
+        self.prefetcher = None
+        self.pending = None
+        self.verifier = Verifier() if verify else None
+        self.keepalives = []
+        if keepalive:  # ping idle devices every `keepalive` seconds, reconnecting them early
+            members = self.session.members if pooled else [self.session]
+            self.keepalives = [sessions.Keepalive.attach(getattr(member, 'session', member),
+                                                         keepalive)
+                               for member in members]
+
+    def _device(self, path=None):
+        device = self.backend(path=path, **self.options)
+        device.ui = self.ui
+        return device
+
+    def with_params(self, pidx, kidx=0, transferable=True, stem=None, icount=1, ncount=1,
+                    dcode=MtrDex.Blake3_256):
+        """Return a shim for other key parameters, sharing this one's device session and key cache."""
+        shim = copy.copy(self)
+        shim.pidx = pidx
+        shim.kidx = kidx
+        shim.transferable = transferable
+        shim.stem = stem if stem is not None else self.STEM
+        shim.icount = icount
+        shim.ncount = ncount
+        shim.dcode = dcode
+        shim.prefetch = 0
+        shim.prefetcher = None
+        shim.pending = None
+        return shim
 
     def params(self):
         return dict(
@@ -47,105 +241,343 @@ class TrezorShim:
 
     def incept(self, transferable=True):
 
-        keys = self._keys( self.icount, self.kidx, transferable)
-        nkeys = self._keys(self.ncount, self.kidx + self.icount, True)
-        ndigs = [coring.Diger(ser=nkey.encode('utf-8'), code=self.dcode).qb64 for nkey in nkeys]
+        with metrics.timer('trezor_shim_operation_seconds', operation='incept'), self.session:
+            self._bind()
+            keys = self._keys( self.icount, self.kidx, transferable)
+            nkeys = self._keys(self.ncount, self.kidx + self.icount, True)
+        ndigs = digest(nkeys, self.dcode)
+        self._refill()
 
         return keys, ndigs
 
+    def _bind(self):
+        """Bind the key cache to the connected device seed, dropping keys of any other seed."""
+        self.cache.bind(self.session.fingerprint)
+
+    def _refill(self):
+        """Derive the next keys of the following `prefetch` rotations in the background."""
+        if not self.prefetch:
+            return
+        if self.prefetcher is None:
+            self.prefetcher = futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='trezor-shim-prefetch')
+        start = self.kidx + self.icount + self.ncount  # later rotations keep ncount keys
+        kidxs = range(start, start + self.prefetch * self.ncount)
+        self.pending = self.prefetcher.submit(self._fill, (self.stem, self.pidx, self.dcode), kidxs)
+
+    def _fill(self, scope, kidxs):
+        stem, pidx, dcode = scope
+
+        def cached(kidx):
+            return self.cache.peek((stem, pidx, kidx, formats.CURVE_ED25519), MtrDex.Ed25519)
+
+        def fill(kidx):
+            if (self.stem, self.pidx, self.dcode) == scope:  # else invalidated while filling
+                self._verfer(kidx, True)
+
+        try:
+            missing = [kidx for kidx in kidxs if cached(kidx) is None]
+            if missing:
+                self._paths(missing[0], missing[-1] + 1 - missing[0])
+                with self.session:
+                    self._bind()
+                    self._map(fill, missing)
+            nkeys = [cached(kidx) for kidx in kidxs]
+            digest([verfer.qb64 for verfer in nkeys if verfer is not None], dcode)
+            log.debug('prefetched %d keys of %s-%s', len(missing), stem, pidx)
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning('prefetching keys failed: %s', e)
+
+    def _prefetched(self, ncount, transferable):
+        """Return the keys and next-key digests of the next rotation, if all keys are cached."""
+        if self.pending is not None:
+            self.pending.result()  # the cache is being filled with the keys needed now
+        start = self.kidx + self.icount
+        code = coring.MtrDex.Ed25519 if transferable else coring.MtrDex.Ed25519N
+        keys = [self.cache.peek((self.stem, self.pidx, k, formats.CURVE_ED25519), code)
+                for k in range(start, start + self.ncount)]
+        nkeys = [self.cache.peek((self.stem, self.pidx, k, formats.CURVE_ED25519), MtrDex.Ed25519)
+                 for k in range(start + self.ncount, start + self.ncount + ncount)]
+        if None in keys or None in nkeys:
+            return None
+        return [verfer.qb64 for verfer in keys], digest([verfer.qb64 for verfer in nkeys], self.dcode)
+
+    def pubkey(self, kidx, transferable=True):
+        """Return the qb64 verification key of key `kidx`."""
+        with metrics.timer('trezor_shim_operation_seconds', operation='pubkey'), self.session:
+            self._bind()
+            return self._verfer(kidx, transferable).qb64
+
     def _keys(self, count, kidx, transferable):
-        keys = []
-        for idx in range(count):
-            key_id = f"{self.stem}-{self.pidx}-{kidx + idx}"
-            with self.device:
-                verkey = self.device.pubkey(key_id=key_id, ecdh=False)
-            verfer = coring.Verfer(raw=verkey,
-                                   code=coring.MtrDex.Ed25519 if transferable
-                                   else coring.MtrDex.Ed25519N)
-            keys.append(verfer.qb64)
-
-        return keys
+        self._paths(kidx, count)
+        return self._map(lambda k: self._verfer(k, transferable).qb64, range(kidx, kidx + count))
+
+    def _paths(self, kidx, count):
+        """
+        Derive the BIP32 paths of keys `kidx` onwards in one pass, ahead of their device calls.
+
+        The paths are memoized by interface.bip32_address, so the device calls
+        that follow (on the worker thread or pooled devices) find them ready.
+        """
+        interface.signify_addresses(self.stem, self.pidx, kidx, count)
+
+    def _map(self, fn, items):
+        """Apply `fn` to each item, spreading the calls over pooled devices."""
+        if self.session.width == 1:
+            return [fn(item) for item in items]
+        with futures.ThreadPoolExecutor(max_workers=self.session.width) as executor:
+            return list(executor.map(fn, items))
+
+    def _verfer(self, kidx, transferable):
+        """Return the Verfer of key `kidx`, asking the device only on a cache miss."""
+        key = (self.stem, self.pidx, kidx, formats.CURVE_ED25519)
+        code = coring.MtrDex.Ed25519 if transferable else coring.MtrDex.Ed25519N
+        key_id = f"{self.stem}-{self.pidx}-{kidx}"
+        return self.cache.load(key, code, lambda: self.session.call('pubkey', key_id=key_id,
+                                                                     ecdh=False))
+
+    def _signer(self, ser, kidx, transferable, checks=None):
+        """
+        Sign `ser` with key `kidx` in one device exchange, returning (sig, verfer).
+
+        With a verifier, the check of the signature is queued and appended to `checks`.
+        """
+        key = (self.stem, self.pidx, kidx, formats.CURVE_ED25519)
+        code = coring.MtrDex.Ed25519 if transferable else coring.MtrDex.Ed25519N
+        key_id = f"{self.stem}-{self.pidx}-{kidx}"
+        sig, verkey = self.session.call('sign_with_pubkey', key_id=key_id, blob=ser)
+        verfer = self.cache.verfer(key, code)
+        if verfer is None:
+            verfer = self.cache.put(key, verkey, code)
+        elif verfer.raw != verkey:  # device derived a different key: wrong seed or passphrase
+            raise interface.DeviceError(f"{self.device} signed {key_id} with unexpected "
+                                        f"key {verkey.hex()}, expected {verfer.raw.hex()}")
+        if self.verifier is not None:
+            checks.append(self.verifier.submit(ser, sig, verfer, key_id))
+        return sig, verfer
 
     def rotate(self, ncount, transferable):
-        keys = self._keys(self.ncount, self.kidx + self.icount, transferable)
-        self.kidx = self.kidx + self.icount
-        self.icount = self.ncount
-        self.ncount = ncount
-        nkeys = self._keys(self.ncount, self.kidx + self.icount, True)
-        ndigs = [coring.Diger(ser=nkey, code=self.dcode).qb64 for nkey in nkeys]
+        with metrics.timer('trezor_shim_operation_seconds', operation='rotate'):
+            prefetched = self._prefetched(ncount, transferable) if self.prefetch else None
+            if prefetched is not None:  # served from memory, without the device
+                keys, ndigs = prefetched
+                self.kidx = self.kidx + self.icount
+                self.icount = self.ncount
+                self.ncount = ncount
+            else:
+                with self.session:
+                    self._bind()
+                    keys = self._keys(self.ncount, self.kidx + self.icount, transferable)
+                    self.kidx = self.kidx + self.icount
+                    self.icount = self.ncount
+                    self.ncount = ncount
+                    nkeys = self._keys(self.ncount, self.kidx + self.icount, True)
+                ndigs = digest(nkeys, self.dcode)
+        self._refill()
 
         return keys, ndigs
 
     def sign(self, ser, indexed=True, indices=None, ondices=None, **_):
-        signers = []
-        for idx in range(self.icount):
-            key_id = f"{self.stem}-{self.pidx}-{self.kidx + idx}"
-            with self.device:
-                verkey = self.device.pubkey(key_id=key_id, ecdh=False )
-            verfer = coring.Verfer(raw=verkey,
-                                   code=coring.MtrDex.Ed25519 if self.transferable
-                                   else coring.MtrDex.Ed25519N)
-            with self.device:
-                sig = self.device.sign(blob=ser, key_id=key_id)
-            signers.append((sig, verfer))
+        checks = []
+        with metrics.timer('trezor_shim_operation_seconds', operation='sign'):
+            self._paths(self.kidx, self.icount)
+            with self.session:
+                self._bind()
+                signers = self._map(lambda k: self._signer(ser, k, self.transferable, checks),
+                                    range(self.kidx, self.kidx + self.icount))
+            Verifier.wait(checks)
 
         return sign(signers, indexed, indices, ondices)
 
+    def sign_many(self, sers, indexed=True, indices=None, ondices=None, **_):
+        """
+        Sign each serialization in `sers` with the current keys in one device session.
+
+        Returns a list in the order of `sers` holding the signatures of each item,
+        or the exception raised while signing it, so that one failure does not
+        abort the rest of the batch.
+        """
+        def signed(ser):
+            checks = []
+            try:
+                signers = [self._signer(ser, kidx, self.transferable, checks)
+                           for kidx in range(self.kidx, self.kidx + self.icount)]
+                return sign(signers, indexed, indices, ondices), checks
+            except Exception as e:  # pylint: disable=broad-except
+                log.warning('signing batch item failed: %s', e)
+                return e, checks
+
+        def verified(result, checks):
+            try:
+                Verifier.wait(checks)
+            except Exception as e:  # pylint: disable=broad-except
+                log.warning('signing batch item failed: %s', e)
+                return e
+            return result
+
+        with metrics.timer('trezor_shim_operation_seconds', operation='sign_many'):
+            self._paths(self.kidx, self.icount)
+            with self.session:
+                self._bind()
+                results = self._map(signed, sers)
+            return [verified(result, checks) for result, checks in results]
+
+    def close(self):
+        """Release the device connection held by a long-lived session."""
+        keepalives, self.keepalives = self.keepalives, []  # each hold is dropped once
+        for keepalive in keepalives:
+            keepalive.stop()
+        if self.verifier is not None:
+            self.verifier.close()
+        if self.prefetcher is not None:
+            self.prefetcher.shutdown(wait=True)
+            self.prefetcher = None
+        if self.shared:  # the last shim using the worker closes the device
+            self.shared = False
+            self.session.leave()
+        else:
+            self.session.close()
+
+class AsyncTrezorShim:
+    """
+    Awaitable counterpart of TrezorShim.
+
+    Blocking device I/O runs on a dedicated executor (one worker by default,
+    so operations reach the device in the order they were awaited), keeping
+    the event loop free while the device works or waits for a button press.
+    Cancelling an awaiting task withdraws its job if the device has not
+    started on it yet; a job already running on the device is left to finish.
+    """
+
+    def __init__(self, pidx, executor=None, **kwargs):
+        """C-tor, taking the same arguments as TrezorShim."""
+        self.shim = TrezorShim(pidx, **kwargs)
+        self.owns_executor = executor is None  # else it is the caller's to shut down
+        self.executor = executor if executor is not None else futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='trezor-shim')
+
+    async def _run(self, fn, *args, **kwargs):
+        import asyncio
+        return await asyncio.wrap_future(self.executor.submit(fn, *args, **kwargs))
+
+    async def params(self):
+        return self.shim.params()
+
+    async def incept(self, transferable=True):
+        return await self._run(self.shim.incept, transferable)
+
+    async def rotate(self, ncount, transferable):
+        return await self._run(self.shim.rotate, ncount, transferable)
+
+    async def sign(self, ser, indexed=True, indices=None, ondices=None, **kwargs):
+        return await self._run(self.shim.sign, ser, indexed, indices, ondices, **kwargs)
+
+    async def sign_many(self, sers, indexed=True, indices=None, ondices=None, **kwargs):
+        return await self._run(self.shim.sign_many, sers, indexed, indices, ondices, **kwargs)
+
+    async def close(self):
+        """Release the device, and stop the executor if the shim created it."""
+        await self._run(self.shim.close)
+        if self.owns_executor:
+            self.executor.shutdown(wait=False)
+
+
+def digest(nkeys, dcode=MtrDex.Blake3_256):
+    """Return the qb64 digests with derivation code `dcode` of qb64 next keys `nkeys`."""
+    return [_digest(nkey, dcode) for nkey in nkeys]
+
+
+@caching.memoize(size=4096)
+def _digest(nkey, dcode):
+    return coring.Diger(ser=nkey.encode('utf-8'), code=dcode).qb64
+
+
 def sign(signers, indexed=False, indices=None, ondices=None):
-    if indexed:
-        sigers = []
-        for j, (sig, verfer) in enumerate(signers):
-            if indices:  # not the default get index from indices
-                i = indices[j]  # must be whole number
-                if not isinstance(i, int) or i < 0:
-                    raise ValueError(f"Invalid signing index = {i}, not "
-                                     f"whole number.")
-            else:  # the default
-                i = j  # same index as database
-
-            if ondices:  # not the default get ondex from ondices
-                o = ondices[j]  # int means both, None means current only
-                if not (o is None or
-                        isinstance(o, int) and not isinstance(o, bool) and o >= 0):
-                    raise ValueError(f"Invalid other signing index = {o}, not "
-                                     f"None or not whole number.")
-            else:  # default
-                o = i  # must both be same value int
-            # .sign assigns .verfer of siger and sets code of siger
-            # appropriately for single or dual indexed signatures
-            sigers.append(ding(sig, verfer,
-                               index=i,
-                               only=True if o is None else False,
-                               ondex=o))
-        return [siger.qb64 for siger in sigers]
-
-    else:
-        cigars = []
-        for sig, verfer in signers:
-            cigars.append(ding(sig, verfer, index=None, only=False, ondex=None))  # assigns .verfer to cigar
-
-        return [cigar.qb64 for cigar in cigars]
+    return encode([sig for sig, _ in signers], indexed, indices, ondices)
+
+
+def encode(sigs, indexed=False, indices=None, ondices=None):
+    """
+    Return the qb64 of raw Ed25519 signatures `sigs`, as Sigers if `indexed` else as Cigars.
+
+    The result is the same as the qb64 of a Siger or Cigar built with ding() for each
+    signature, without building them: the code and indices prefix is computed once
+    per distinct code and indices, and the signatures are base64-encoded after it.
+    """
+    if not indexed:
+        prefix = _prefix(MtrDex.Ed25519_Sig)
+        return [prefix + _b64(sig) if len(sig) == SIG_SIZE else
+                ding(sig, None, index=None, only=False, ondex=None).qb64 for sig in sigs]
+
+    qb64s = []
+    for j, sig in enumerate(sigs):
+        if indices:  # not the default get index from indices
+            i = indices[j]  # must be whole number
+            if not isinstance(i, int) or i < 0:
+                raise ValueError(f"Invalid signing index = {i}, not "
+                                 f"whole number.")
+        else:  # the default
+            i = j  # same index as database
+
+        if ondices:  # not the default get ondex from ondices
+            o = ondices[j]  # int means both, None means current only
+            if not (o is None or
+                    isinstance(o, int) and not isinstance(o, bool) and o >= 0):
+                raise ValueError(f"Invalid other signing index = {o}, not "
+                                 f"None or not whole number.")
+        else:  # default
+            o = i  # must both be same value int
+
+        if len(sig) != SIG_SIZE:  # let Siger report the invalid signature
+            qb64s.append(ding(sig, None, index=i, only=o is None, ondex=o).qb64)
+            continue
+        code, ondex = sig_code(i, o is None, o)
+        qb64s.append(_prefix(code, i, ondex) + _b64(sig))
+    return qb64s
+
+
+@caching.memoize(size=4096)
+def _prefix(code, index=None, ondex=None):
+    """Code and indices of a signature, as in the qb64 of a Siger or Cigar."""
+    blank = bytes(SIG_SIZE)
+    if index is None:
+        return Cigar(raw=blank, code=code).qb64[:-len(_b64(blank))]
+    hs, ss, os, _, _ = Indexer.Sizes[code]
+    ms = ss - os
+    if index > 64 ** ms - 1 or (ondex is not None and os and ondex > 64 ** os - 1):
+        Siger(raw=blank, code=code, index=index, ondex=ondex)  # raises the same error as ding()
+    return code + intToB64(index, l=ms) + intToB64(ondex if ondex is not None else 0, l=os)
+
+
+def _b64(sig):
+    # pad to a multiple of 3 bytes up front, the pad chars being replaced by the prefix
+    return base64.urlsafe_b64encode(b'\x00\x00' + sig)[2:].decode('ascii')
+
+
+def sig_code(index, only, ondex):
+    """Return the code and ondex of a signature with `index`, and `ondex` unless `only`."""
+    # should add Indexer class method to get ms main index size for given code
+    if only:  # only main index ondex not used
+        ondex = None
+        if index <= 63:  # (64 ** ms - 1) where ms is main index size
+            code = IdrDex.Ed25519_Crt_Sig  # use small current only
+        else:
+            code = IdrDex.Ed25519_Big_Crt_Sig  # use big current only
+    else:  # both
+        if ondex is None:
+            ondex = index  # enable default to be same
+        if ondex == index and index <= 63:  # both same and small
+            code = IdrDex.Ed25519_Sig  # use  small both same
+        else:  # otherwise big or both not same so use big both
+            code = IdrDex.Ed25519_Big_Sig  # use use big both
+    return code, ondex
 
 
 def ding(sig, verfer, index, only, ondex):
     if index is None:  # Must be Cigar i.e. non-indexed signature
         return Cigar(raw=sig, code=MtrDex.Ed25519_Sig, verfer=verfer)
     else:  # Must be Siger i.e. indexed signature
-        # should add Indexer class method to get ms main index size for given code
-        if only:  # only main index ondex not used
-            ondex = None
-            if index <= 63:  # (64 ** ms - 1) where ms is main index size
-                code = IdrDex.Ed25519_Crt_Sig  # use small current only
-            else:
-                code = IdrDex.Ed25519_Big_Crt_Sig  # use big current only
-        else:  # both
-            if ondex is None:
-                ondex = index  # enable default to be same
-            if ondex == index and index <= 63:  # both same and small
-                code = IdrDex.Ed25519_Sig  # use  small both same
-            else:  # otherwise big or both not same so use big both
-                code = IdrDex.Ed25519_Big_Sig  # use use big both
-
+        code, ondex = sig_code(index, only, ondex)
         return Siger(raw=sig,
                      code=code,
                      index=index,
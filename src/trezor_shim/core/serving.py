@@ -0,0 +1,355 @@
+"""
+Signing daemon owning the device, and the proxy shim talking to it.
+
+The daemon keeps one warm device session and serves the operations of any
+number of client processes over a Unix socket. Requests and responses are
+length-prefixed JSON frames. Every request carries an id, echoed by its
+response, and responses may come back out of order, so that clients pipeline
+many requests on one connection:
+
+    {"id": 1, "op": "sign", "params": {...}, "args": {"ser": ...}}
+    -> {"id": 1, "result": [...], "params": {...}}
+    -> {"id": 1, "error": {"type": "DeviceError", "message": ...}}
+
+`params` are the key parameters of TrezorShim.params(); byte strings are sent
+base64-encoded. Device calls of all requests are queued into the one session.
+"""
+import argparse
+import base64
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from concurrent import futures
+
+from keri.core.coring import MtrDex
+
+from ..trezor import agent
+from ..trezor import interface
+from ..trezor import util
+from . import keeping
+
+log = logging.getLogger(__name__)
+
+# Exceptions re-raised by the proxy, by name; others become a DeviceError.
+ERRORS = {
+    'DeviceError': interface.DeviceError,
+    'NotFoundError': interface.NotFoundError,
+    'ValueError': ValueError,
+}
+
+
+def default_path():
+    """Daemon socket path in the user's runtime directory."""
+    return os.environ.get('TREZOR_SHIM_DAEMON') or agent.default_path('serve.sock')
+
+
+def encode(blob):
+    return base64.b64encode(blob).decode('ascii')
+
+
+def decode(text):
+    return base64.b64decode(text)
+
+
+def error(e):
+    """Serialize exception `e`."""
+    return {'type': type(e).__name__, 'message': str(e)}
+
+
+def exception(err):
+    """Deserialize an exception serialized by error()."""
+    return ERRORS.get(err['type'], interface.DeviceError)(err['message'])
+
+
+class Daemon:
+    """Serve shim operations from a single warm device session."""
+
+    def __init__(self, workers=8, **kwargs):
+        """C-tor, taking the device arguments of TrezorShim (e.g. `backend` or `pooled`)."""
+        kwargs.setdefault('idle_timeout', float('inf'))
+        kwargs.setdefault('threaded', True)  # a worker thread owns the device
+        self.shim = keeping.TrezorShim(pidx=0, **kwargs)
+        self.executor = futures.ThreadPoolExecutor(max_workers=workers,
+                                                   thread_name_prefix='trezor-shim-serve')
+
+    def respond(self, request):
+        """Return the response to one request."""
+        try:
+            op = getattr(self, 'op_' + request['op'], None)
+            if op is None:
+                raise ValueError('unknown op {!r}'.format(request['op']))
+            shim = self.shim.with_params(**request.get('params', {}))
+            result = op(shim, **request.get('args', {}))
+            return {'id': request.get('id'), 'result': result, 'params': shim.params()}
+        except Exception as e:  # pylint: disable=broad-except
+            log.warning('%s request failed: %s', request.get('op'), e)
+            return {'id': request.get('id'), 'error': error(e)}
+
+    @staticmethod
+    def op_pubkey(shim, kidx, transferable=True):
+        return shim.pubkey(kidx, transferable)
+
+    @staticmethod
+    def op_incept(shim, transferable=True):
+        return list(shim.incept(transferable))
+
+    @staticmethod
+    def op_rotate(shim, ncount, transferable):
+        return list(shim.rotate(ncount, transferable))
+
+    @staticmethod
+    def op_sign(shim, ser, indexed=True, indices=None, ondices=None):
+        return shim.sign(decode(ser), indexed, indices, ondices)
+
+    @staticmethod
+    def op_sign_many(shim, sers, indexed=True, indices=None, ondices=None):
+        results = shim.sign_many([decode(ser) for ser in sers], indexed, indices, ondices)
+        return [{'error': error(r)} if isinstance(r, Exception) else r for r in results]
+
+    def serve(self, path):
+        """Listen on the Unix socket at `path` until interrupted."""
+        server = self.bind(path)
+        log.info('serving %s on %s', self.shim.device, path)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(path)
+            self.close()
+
+    def bind(self, path):
+        """Create the server socket at `path`, accessible to the current user only."""
+        return util.private_unix_server(path, lambda path: Server(path, self))
+
+    def close(self):
+        """Stop serving and close the device."""
+        self.executor.shutdown(wait=True)
+        self.shim.close()
+
+
+class Handler(socketserver.BaseRequestHandler):
+    """Read the requests of one client connection, answering each once it is done."""
+
+    def handle(self):
+        """Dispatch frames until the client disconnects."""
+        if not util.same_user(self.request):
+            log.warning('refusing connection from another user')
+            return
+        lock = threading.Lock()  # one response frame at a time
+
+        def reply(request):
+            response = self.server.daemon.respond(request)
+            try:
+                with lock:
+                    util.send_frame(self.request, json.dumps(response).encode('utf-8'))
+            except OSError as e:
+                log.debug('client left before response %s: %s', response['id'], e)
+
+        def refuse(e, request_id=None):
+            log.warning('refusing request %s: %s', request_id, e)
+            with lock:
+                util.send_frame(self.request, json.dumps(
+                    {'id': request_id, 'error': error(e)}).encode('utf-8'))
+
+        while True:
+            try:
+                request = json.loads(util.read_frame(self.request))
+                if not isinstance(request, dict):
+                    raise ValueError('request is not an object')
+            except (EOFError, OSError):
+                return
+            except ValueError as e:  # the frame was read whole, the next one is intact
+                refuse(e)
+                continue
+            try:
+                self.server.daemon.executor.submit(reply, request)
+            except RuntimeError as e:  # the daemon is closing
+                refuse(interface.DeviceError('daemon closed: {}'.format(e)), request.get('id'))
+                return
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server of a Daemon."""
+
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        """C-tor."""
+        self.daemon = daemon
+        super().__init__(path, Handler)
+
+
+class ProxyShim:
+    """
+    Drop-in replacement of TrezorShim, forwarding operations to a daemon.
+
+    Key parameters are kept here and sent along with every request. The
+    connection is shared by all threads using the proxy: requests are sent
+    without waiting for earlier ones to be answered.
+    """
+
+    STEM = keeping.TrezorShim.STEM
+
+    def __init__(self, pidx, kidx=0, transferable=True, stem=None, count=1, ncount=1,
+                 dcode=MtrDex.Blake3_256, daemon=None, **_):
+        """C-tor; `daemon` is the socket path, or True for the default one."""
+        self.icount = count
+        self.ncount = ncount
+        self.dcode = dcode
+        self.pidx = pidx
+        self.kidx = kidx
+        self.transferable = transferable
+        self.stem = stem if stem is not None else self.STEM
+
+        self.path = daemon if isinstance(daemon, str) else default_path()
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pending = {}  # request id -> Future
+        self.ids = itertools.count(1)
+
+    def params(self):
+        return dict(
+            pidx=self.pidx,
+            kidx=self.kidx,
+            stem=self.stem,
+            icount=self.icount,
+            ncount=self.ncount,
+            dcode=self.dcode,
+            transferable=self.transferable
+        )
+
+    def pubkey(self, kidx, transferable=True):
+        return self.call('pubkey', kidx=kidx, transferable=transferable)['result']
+
+    def incept(self, transferable=True):
+        keys, ndigs = self.call('incept', transferable=transferable)['result']
+        return keys, ndigs
+
+    def rotate(self, ncount, transferable):
+        response = self.call('rotate', ncount=ncount, transferable=transferable)
+        params = response['params']
+        self.kidx, self.icount, self.ncount = params['kidx'], params['icount'], params['ncount']
+        keys, ndigs = response['result']
+        return keys, ndigs
+
+    def sign(self, ser, indexed=True, indices=None, ondices=None, **_):
+        return self.call('sign', ser=encode(ser), indexed=indexed, indices=indices,
+                         ondices=ondices)['result']
+
+    def sign_many(self, sers, indexed=True, indices=None, ondices=None, **_):
+        results = self.call('sign_many', sers=[encode(ser) for ser in sers], indexed=indexed,
+                            indices=indices, ondices=ondices)['result']
+        return [exception(r['error']) if isinstance(r, dict) else r for r in results]
+
+    def call(self, op, **args):
+        """Send a request and wait for its response, raising the error it carries."""
+        response = self.submit(op, **args).result()
+        if 'error' in response:
+            raise exception(response['error'])
+        return response
+
+    def submit(self, op, **args):
+        """Send a request and return a future of its response."""
+        future = futures.Future()
+        with self.lock:
+            if self.conn is None:
+                self.conn = self._connect()
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+            request = dict(id=request_id, op=op, params=self.params(), args=args)
+            try:
+                util.send_frame(self.conn, json.dumps(request).encode('utf-8'))
+            except OSError as e:
+                del self.pending[request_id]
+                self._drop(self.conn)
+                raise interface.DeviceError('{} unreachable: {}'.format(self.path, e)) from e
+        return future
+
+    def close(self):
+        """Close the connection to the daemon."""
+        with self.lock:
+            if self.conn is not None:
+                self._drop(self.conn)
+
+    def _connect(self):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            conn.connect(self.path)
+        except OSError as e:
+            conn.close()
+            raise interface.NotFoundError('no daemon at {}: {}'.format(self.path, e)) from e
+        if not util.same_user(conn):
+            conn.close()
+            raise interface.NotFoundError('daemon at {} runs as another user'.format(self.path))
+        threading.Thread(target=self._read, args=(conn,), name='trezor-shim-proxy',
+                         daemon=True).start()
+        return conn
+
+    def _read(self, conn):
+        while True:
+            try:
+                response = json.loads(util.read_frame(conn))
+            except (EOFError, OSError, ValueError):
+                break
+            with self.lock:
+                future = self.pending.pop(response.get('id'), None)
+            if future is not None:
+                future.set_result(response)
+        with self.lock:
+            self._drop(conn)
+
+    def _drop(self, conn):
+        """Close `conn`, failing the requests still waiting on it (with the lock held)."""
+        if self.conn is conn:
+            self.conn = None
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                future.set_exception(interface.DeviceError('{} disconnected'.format(self.path)))
+        try:
+            conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        conn.close()
+
+
+def add_arguments(p):
+    """Add the daemon options to argument parser `p`."""
+    p.add_argument('--socket', default=default_path(), help='Unix socket to listen on')
+    p.add_argument('--backend', default='trezor', choices=sorted(keeping.BACKENDS),
+                   help='device implementation')
+    p.add_argument('--pooled', action='store_true',
+                   help='use every connected device restored from the same seed')
+    p.add_argument('--verify', action='store_true',
+                   help='check device signatures on the host before answering')
+    p.add_argument('--keepalive', type=float, default=None, metavar='SECONDS',
+                   help='ping the idle device this often, reconnecting it as soon as it is back')
+    p.add_argument('--workers', type=int, default=8, help='requests handled concurrently')
+    p.add_argument('--cache-size', type=int, default=1024, help='verification keys kept in memory')
+    p.add_argument('-v', '--verbose', default=0, action='count')
+
+
+def run(args):
+    """Run the daemon in the foreground, configured by parsed `args`."""
+    util.setup_logging(verbosity=args.verbose)
+    daemon = Daemon(workers=args.workers, backend=args.backend, pooled=args.pooled,
+                    cache_size=args.cache_size, verify=args.verify,
+                    keepalive=args.keepalive)
+    try:
+        daemon.serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """Run the daemon in the foreground."""
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    add_arguments(p)
+    run(p.parse_args())
+
+
+if __name__ == '__main__':
+    main()
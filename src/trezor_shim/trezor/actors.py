@@ -0,0 +1,135 @@
+"""Worker threads owning device sessions."""
+import logging
+import queue
+import threading
+from concurrent import futures
+
+log = logging.getLogger(__name__)
+
+
+class DeviceActor:
+    """
+    Worker thread owning one device session, fed through a request queue.
+
+    Exposes the same interface as `sessions.Session`, but every operation,
+    from any number of threads, is queued and run in order by the worker,
+    which is the only thread touching the transport. Callers share one warm
+    session without locking around their calls. An actor obtained through
+    shared() is left with leave(), the last owner closing the device.
+    """
+
+    width = 1  # number of devices serving calls concurrently
+
+    shared_actors = {}
+    shared_lock = threading.Lock()
+
+    def __init__(self, session):
+        """C-tor."""
+        self.session = session
+        self.device = session.device
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.key = None  # in shared_actors
+        self.owners = 0  # shared() calls not matched by a leave() yet
+        session.dispatch = self._submit  # idle expiry runs on the worker too
+
+    @classmethod
+    def shared(cls, key, factory):
+        """Return the process-wide actor of the device `key`, creating its session with `factory()`."""
+        with cls.shared_lock:
+            actor = cls.shared_actors.get(key)
+            if actor is None:
+                actor = cls.shared_actors[key] = cls(factory())
+                actor.key = key
+            actor.owners += 1
+            return actor
+
+    def leave(self):
+        """Drop an ownership taken by shared(); the last owner closes the device and stops the worker."""
+        with self.shared_lock:
+            self.owners = max(self.owners - 1, 0)
+            if self.owners:
+                return
+            if self.shared_actors.get(self.key) is self:
+                del self.shared_actors[self.key]
+        self.stop()
+
+    @property
+    def connected(self):
+        """True if the device connection is open."""
+        return self.session.connected
+
+    @property
+    def fingerprint(self):
+        """Seed fingerprint of the connected device."""
+        return self._call(lambda: self.session.fingerprint)
+
+    def submit(self, method, *args, **kwargs):
+        """Queue a device method call and return a future of its result."""
+        return self._submit(self.session.call, method, *args, **kwargs)
+
+    def call(self, method, *args, **kwargs):
+        """Run a device method on the worker and wait for its result."""
+        return self._call(self.session.call, method, *args, **kwargs)
+
+    def acquire(self):
+        """Hold the session open on the worker."""
+        self._call(self.session.acquire)
+        return self
+
+    def release(self):
+        """Drop a hold on the session."""
+        self._call(self.session.release)
+
+    def close(self):
+        """Close the device connection."""
+        self._call(self.session.close)
+
+    def stop(self):
+        """Close the device connection and stop the worker thread."""
+        self.close()
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is not None:
+            self.jobs.put(None)
+            thread.join()
+
+    def _call(self, fn, *args, **kwargs):
+        if threading.current_thread() is self.thread:  # re-entrant call from a job
+            return fn(*args, **kwargs)
+        return self._submit(fn, *args, **kwargs).result()
+
+    def _submit(self, fn, *args, **kwargs):
+        future = futures.Future()
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, args=(self.jobs,),
+                                               name='{}-actor'.format(self.device), daemon=True)
+                self.thread.start()
+            self.jobs.put((future, fn, args, kwargs))
+        return future
+
+    def _run(self, jobs):
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            future, fn, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as e:  # pylint: disable=broad-except
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+        log.debug('%s worker stopped', self.device)
+
+    def __enter__(self):
+        """Allow usage as context manager."""
+        return self.acquire()
+
+    def __exit__(self, *args):
+        """Release the hold taken by __enter__."""
+        self.release()
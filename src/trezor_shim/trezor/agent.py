@@ -0,0 +1,178 @@
+"""
+Passphrase agent shared by the signer processes of one user, similar to gpg-agent.
+
+The agent listens on a Unix socket and holds passphrases for `ttl` seconds
+after they were entered, so that other processes unlock the device without
+prompting again. Requests and responses are length-prefixed JSON frames:
+
+    {"op": "get", "key": ...}                          -> {"value": ... or null}
+    {"op": "set", "key": ..., "value": ..., "ttl": ...} -> {"ok": true}
+    {"op": "clear"}                                     -> {"ok": true}
+
+Run it with `python -m trezor_shim.trezor.agent`, and point signers at it with
+`$TREZOR_SHIM_AGENT`.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import tempfile
+
+from . import caching
+from . import util
+
+log = logging.getLogger(__name__)
+
+DEFAULT_TTL = 600.0
+
+
+def default_path(name='agent.sock'):
+    """Path of socket `name` in the user's runtime directory."""
+    runtime = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(runtime, 'trezor-shim-{}'.format(os.getuid()), name)
+
+
+def client(path=None):
+    """Return a Client of the agent at `path` or `$TREZOR_SHIM_AGENT`, or None if not configured."""
+    path = path or os.environ.get('TREZOR_SHIM_AGENT')
+    return Client(path) if path else None
+
+
+class Client:
+    """Connection to a running agent; lookups fail softly when it is not running."""
+
+    def __init__(self, path):
+        """C-tor."""
+        self.path = path
+
+    def get(self, key):
+        """Return the value held for `key`, or None."""
+        return self._request(op='get', key=key).get('value')
+
+    def set(self, key, value, ttl=None):
+        """Hold `value` for `key`, for `ttl` seconds or the agent's default."""
+        self._request(op='set', key=key, value=value, ttl=ttl)
+
+    def clear(self):
+        """Forget every value held by the agent."""
+        self._request(op='clear')
+
+    def _request(self, **request):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+                conn.connect(self.path)
+                if not util.same_user(conn):
+                    raise PermissionError('listening as another user')
+                util.send_frame(conn, json.dumps(request).encode('utf-8'))
+                return json.loads(util.read_frame(conn))
+        except (OSError, EOFError, ValueError) as e:
+            log.debug('agent at %s unavailable: %s', self.path, e)
+            return {}
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Serve the requests of one client connection."""
+
+    def handle(self):
+        """Answer frames until the client disconnects."""
+        if not util.same_user(self.request):
+            log.warning('refusing connection from another user')
+            return
+        while True:
+            try:
+                request = json.loads(util.read_frame(self.request))
+            except (EOFError, OSError):
+                return
+            except ValueError as e:
+                response = {'error': 'malformed request: {}'.format(e)}
+            else:
+                response = self.server.agent.respond(request)
+            util.send_frame(self.request, json.dumps(response).encode('utf-8'))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server of an Agent."""
+
+    daemon_threads = True
+
+    def __init__(self, path, agent):
+        """C-tor."""
+        self.agent = agent
+        super().__init__(path, Handler)
+
+
+class Agent:
+    """Passphrases held in memory for `ttl` seconds."""
+
+    def __init__(self, ttl=DEFAULT_TTL, size=64):
+        """C-tor."""
+        self.ttl = ttl
+        self.values = caching.TTLCache(ttl=ttl, size=size)
+
+    def respond(self, request):
+        """Return the response to one request."""
+        if not isinstance(request, dict):
+            return {'error': 'request is not an object'}
+        try:
+            return self._respond(request)
+        except (KeyError, TypeError, ValueError) as e:
+            return {'error': 'bad {} request: {!r}'.format(request.get('op'), e)}
+
+    def _respond(self, request):
+        op = request.get('op')
+        if op == 'get':
+            return {'value': self.values.get(request['key'])}
+        if op == 'set':
+            ttl = request.get('ttl')
+            ttl = self.ttl if ttl is None else min(float(ttl), self.ttl)
+            self.values.put(request['key'], request['value'], ttl=ttl)
+            return {'ok': True}
+        if op == 'clear':
+            self.values.clear()
+            return {'ok': True}
+        return {'error': 'unknown op {!r}'.format(op)}
+
+    def serve(self, path):
+        """Listen on the Unix socket at `path` until interrupted."""
+        server = self.bind(path)
+        log.info('agent listening on %s', path)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(path)
+
+    def bind(self, path):
+        """Create the server socket at `path`, accessible to the current user only."""
+        return util.private_unix_server(path, lambda path: Server(path, self))
+
+
+def add_arguments(p):
+    """Add the agent options to argument parser `p`."""
+    p.add_argument('--socket', default=os.environ.get('TREZOR_SHIM_AGENT') or default_path(),
+                   help='Unix socket to listen on')
+    p.add_argument('--ttl', type=float, default=DEFAULT_TTL,
+                   help='seconds to hold a passphrase for')
+    p.add_argument('-v', '--verbose', default=0, action='count')
+
+
+def run(args):
+    """Run the agent in the foreground, configured by parsed `args`."""
+    util.setup_logging(verbosity=args.verbose)
+    try:
+        Agent(ttl=args.ttl).serve(args.socket)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    """Run the agent in the foreground."""
+    p = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    add_arguments(p)
+    run(p.parse_args())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+"""Bounded in-memory caches, with expiry, single-flight loading and statistics."""
+import collections
+import functools
+import threading
+import time
+from concurrent import futures
+
+from . import metrics
+
+# Snapshot of the lookups and removals counted by a cache.
+CacheStats = collections.namedtuple('CacheStats', 'hits misses evictions expirations size')
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Keyed cache holding at most `size` entries, evicting the least recently used.
+
+    With `ttl`, entries also expire `ttl` seconds after they were stored, and
+    are dropped by the first get() or put() past their deadline, whatever its key.
+    `on_evict(key, value)` is called for every entry leaving the cache, be it
+    evicted, expired, invalidated or cleared. With `metric`, hits, misses,
+    evictions and expirations are also counted into that counter, by result.
+    """
+
+    def __init__(self, size=1024, ttl=None, timer=time.monotonic, on_evict=None, metric=None):
+        """C-tor."""
+        self.size = size
+        self.ttl = ttl
+        self.timer = timer
+        self.on_evict = on_evict
+        self.metric = metric
+        self.lock = threading.RLock()
+        self.entries = collections.OrderedDict()  # key -> (deadline, value)
+        self.next_expiry = None  # earliest deadline of the entries, if any
+        self.loading = {}  # key -> Future of the value being loaded
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        """Return the value of `key`, or `default` if missing or expired."""
+        with self.lock:
+            self._evicted(self._purge())
+            value = self._lookup(key)
+        return default if value is _MISSING else value
+
+    def peek(self, key, default=None):
+        """Return the value of `key` like get(), without counting the lookup or refreshing it."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self._expired(entry):
+                return default
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        """
+        Store `value` for `key`, evicting the least recently used entries over `size`.
+
+        The entry expires after `ttl` seconds if given, else after the cache's own `ttl`.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        deadline = None if ttl is None else self.timer() + ttl
+        with self.lock:
+            removed = self._purge()
+            old = self.entries.pop(key, None)
+            if old is not None and old[1] is not value:
+                removed.append((key, old[1]))
+            self.entries[key] = (deadline, value)
+            if deadline is not None and (self.next_expiry is None or deadline < self.next_expiry):
+                self.next_expiry = deadline
+            while self.size is not None and len(self.entries) > self.size:
+                removed.append(self.entries.popitem(last=False))
+                self._count('evict')
+        self._evicted(removed)
+        return value
+
+    def load(self, key, loader):
+        """
+        Return the value of `key`, calling `loader()` to compute it when missing.
+
+        Concurrent loads of the same key share a single `loader()` call.
+        """
+        with self.lock:
+            value = self._lookup(key, count=False)
+            if value is not _MISSING:
+                self._count('hit')
+                return value
+            future = self.loading.get(key)
+            owner = future is None
+            self._count('miss' if owner else 'hit')  # or another thread is loading it already
+            if owner:
+                future = self.loading[key] = futures.Future()
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            with self.lock:
+                del self.loading[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.put(key, value)
+            del self.loading[key]
+        future.set_result(value)
+        return value
+
+    def invalidate(self, key):
+        """Drop the entry of `key`, if any."""
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        if entry is not None:
+            self._evicted([(key, entry[1])])
+
+    def clear(self):
+        """Drop every entry."""
+        with self.lock:
+            removed = [(key, value) for key, (_, value) in self.entries.items()]
+            self.entries.clear()
+            self.next_expiry = None
+        self._evicted(removed)
+
+    def purge(self):
+        """Drop every expired entry now."""
+        with self.lock:
+            removed = self._purge()
+        self._evicted(removed)
+
+    def stats(self):
+        """Return the lookups and removals counted so far."""
+        with self.lock:
+            return CacheStats(self.hits, self.misses, self.evictions, self.expirations,
+                              len(self.entries))
+
+    def __contains__(self, key):
+        """True if `key` has a live entry."""
+        return self.peek(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        """Number of entries, including expired ones not dropped yet."""
+        return len(self.entries)
+
+    def _lookup(self, key, count=True):
+        entry = self.entries.get(key)
+        if entry is not None and self._expired(entry):
+            del self.entries[key]
+            self._count('expire')
+            self._evicted([(key, entry[1])])
+            entry = None
+        if entry is None:
+            if count:
+                self._count('miss')
+            return _MISSING
+        self.entries.move_to_end(key)
+        if count:
+            self._count('hit')
+        return entry[1]
+
+    def _purge(self):
+        """Drop the expired entries once the earliest deadline passed, and return them."""
+        if self.next_expiry is None or self.timer() < self.next_expiry:
+            return []
+        now = self.timer()
+        removed = [(key, value) for key, (deadline, value) in self.entries.items()
+                   if deadline is not None and now >= deadline]
+        for key, _ in removed:
+            del self.entries[key]
+            self._count('expire')
+        deadlines = [deadline for deadline, _ in self.entries.values() if deadline is not None]
+        self.next_expiry = min(deadlines) if deadlines else None
+        return removed
+
+    def _expired(self, entry):
+        return entry[0] is not None and self.timer() >= entry[0]
+
+    def _count(self, result):
+        if result == 'hit':
+            self.hits += 1
+        elif result == 'miss':
+            self.misses += 1
+        elif result == 'evict':
+            self.evictions += 1
+        else:
+            self.expirations += 1
+        if self.metric:
+            metrics.inc(self.metric, result=result)
+
+    def _evicted(self, removed):
+        if self.on_evict is not None:
+            for key, value in removed:
+                self.on_evict(key, value)
+
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries expire `ttl` seconds after they were stored."""
+
+    def __init__(self, ttl, size=1024, **kwargs):
+        """C-tor."""
+        super().__init__(size=size, ttl=ttl, **kwargs)
+
+
+def _key(args, kwargs):
+    return (args, tuple(sorted(kwargs.items()))) if kwargs else args
+
+
+def memoize(size=1024, ttl=None):
+    """Decorate a function to cache its results by arguments, in an LRUCache at `wrapper.cache`."""
+    def decorator(func):
+        cache = LRUCache(size=size, ttl=ttl)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.load(_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def memoize_method(size=1024, ttl=None):
+    """
+    Decorate a method to cache its results by arguments, with one cache per instance.
+
+    `wrapper.cache_of(instance)` returns the LRUCache of an instance, e.g. to clear it.
+    """
+    def decorator(method):
+        attr = '_{}_cache'.format(method.__name__)
+        lock = threading.Lock()
+
+        def cache_of(instance):
+            cache = instance.__dict__.get(attr)
+            if cache is None:
+                with lock:
+                    cache = instance.__dict__.setdefault(attr, LRUCache(size=size, ttl=ttl))
+            return cache
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            return cache_of(self).load(_key(args, kwargs), lambda: method(self, *args, **kwargs))
+
+        wrapper.cache_of = cache_of
+        return wrapper
+    return decorator
@@ -0,0 +1,135 @@
+"""Software emulation of a Trezor device, for development and load testing."""
+import hashlib
+import hmac
+import logging
+import os
+import struct
+import unicodedata
+
+from . import formats
+from . import interface
+from . import trezor
+
+log = logging.getLogger(__name__)
+
+HARDENED = 0x80000000
+
+
+def mnemonic_to_seed(mnemonic, passphrase=''):
+    """Return the BIP-0039 seed of `mnemonic`, as restored on a device with `passphrase`."""
+    mnemonic = unicodedata.normalize('NFKD', mnemonic)
+    salt = unicodedata.normalize('NFKD', 'mnemonic' + passphrase)
+    return hashlib.pbkdf2_hmac('sha512', mnemonic.encode('utf-8'), salt.encode('utf-8'), 2048)
+
+
+def derive(seed, address_n, curve_name):
+    """Return the SLIP-0010 private key of the hardened path `address_n`."""
+    key = {formats.CURVE_ED25519: b'ed25519 seed',
+           formats.ECDH_CURVE25519: b'curve25519 seed'}[curve_name]
+    digest = hmac.new(key, seed, hashlib.sha512).digest()
+    secret, chain = digest[:32], digest[32:]
+    for index in address_n:
+        if not index & HARDENED:
+            raise ValueError('{} supports only hardened derivation'.format(curve_name))
+        data = b'\x00' + secret + struct.pack('>L', index)
+        digest = hmac.new(chain, data, hashlib.sha512).digest()
+        secret, chain = digest[:32], digest[32:]
+    return secret
+
+
+def public_key(secret, curve_name):
+    """Return the device encoding (prefix byte + key) of the public key of `secret`."""
+    import nacl.bindings
+    import nacl.signing
+    if curve_name == formats.ECDH_CURVE25519:
+        return b'\x01' + nacl.bindings.crypto_scalarmult_base(secret)
+    return b'\x00' + bytes(nacl.signing.SigningKey(secret).verify_key)
+
+
+class Connection:
+    """Stand-in for `TrezorClient`, holding the emulated device state."""
+
+    def __init__(self, features, session_id):
+        """C-tor."""
+        self.features = features
+        self.session_id = session_id
+
+    def ping(self, msg):
+        """The emulated device always answers."""
+        return msg
+
+    def close(self):
+        """Nothing to release."""
+
+
+class Features:
+    """Subset of the `Features` message reported by the emulator."""
+
+    def __init__(self, device_id, label='emulator'):
+        """C-tor."""
+        self.device_id = device_id
+        self.label = label
+        self.vendor = 'trezor_shim'
+
+
+class SoftTrezor(trezor.Trezor):
+    """
+    Trezor emulated in software from a local seed.
+
+    Keys are derived with SLIP-0010 along the same SLIP-0013 paths a device
+    uses, so they match a real Trezor restored from the same mnemonic and
+    passphrase. The seed lives in host memory: use it for development, CI
+    and load testing only.
+    """
+
+    def __init__(self, path=None, seed=None, mnemonic=None, passphrase=None, **kwargs):
+        """Emulate a device holding `seed`, or the seed of `mnemonic` and `passphrase`."""
+        super().__init__(path=path, **kwargs)
+        if seed is None:
+            mnemonic = mnemonic if mnemonic is not None else os.environ.get('TREZOR_SHIM_MNEMONIC')
+            if mnemonic is None:
+                raise interface.NotFoundError('{} needs a seed or mnemonic'.format(self))
+            if passphrase is None:
+                passphrase = os.environ.get('TREZOR_PASSPHRASE', '')
+            seed = mnemonic_to_seed(mnemonic, passphrase)
+        self.seed = bytes(seed)
+        self.device_id = hashlib.sha256(self.seed).hexdigest()[:24].upper()
+
+    def connect(self):
+        """Open an emulated connection, resuming the cached session if any."""
+        session_id = self.cached_session_id or os.urandom(32)
+        return Connection(features=Features(device_id=self.device_id), session_id=session_id)
+
+    def find_device(self):
+        """The emulated device is always present."""
+        return self
+
+    def pubkey(self, key_id, ecdh=False):
+        """Return public key."""
+        identity = self._create_identity(key_id)
+        curve_name = identity.get_curve_name(ecdh=ecdh)
+        secret = derive(self.seed, identity.get_bip32_address(ecdh=ecdh), curve_name)
+        pubkey = public_key(secret, curve_name)
+        return formats.decode_pubkey(pubkey=pubkey, curve_name=curve_name)
+
+    def sign_with_pubkey(self, key_id, blob):
+        """Sign given blob and return the signature and public key (as bytes)."""
+        identity = self._create_identity(key_id)
+        curve_name = identity.get_curve_name(ecdh=False)
+        if curve_name != formats.CURVE_ED25519:
+            raise interface.DeviceError('{} error: unsupported curve {}'.format(self, curve_name))
+        secret = derive(self.seed, identity.get_bip32_address(ecdh=False), curve_name)
+        import nacl.signing
+        signer = nacl.signing.SigningKey(secret)
+        # signify:// identities sign the hidden challenge as is, like the firmware
+        sig = signer.sign(bytes(blob)).signature
+        return bytes(sig), bytes(signer.verify_key)
+
+    def _ecdh_with_pubkey(self, identity, pubkey):
+        curve_name = identity.get_curve_name(ecdh=True)
+        if curve_name != formats.ECDH_CURVE25519 or pubkey[:1] != b'\x40':
+            raise interface.DeviceError('{} error: unsupported peer key'.format(self))
+        secret = derive(self.seed, identity.get_bip32_address(ecdh=True), curve_name)
+        import nacl.bindings
+        session_key = b'\x04' + nacl.bindings.crypto_scalarmult(secret, bytes(pubkey[1:]))
+        return session_key, public_key(secret, curve_name)[1:]
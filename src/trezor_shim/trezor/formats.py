@@ -2,9 +2,7 @@
 import hashlib
 import logging
 
-import ecdsa
-import nacl.signing
-
+from . import caching
 from . import util
 
 log = logging.getLogger(__name__)
@@ -30,14 +28,21 @@ SUPPORTED_KEY_TYPES = {SSH_NIST256_KEY_TYPE, SSH_NIST256_CERT_TYPE, SSH_ED25519_
 
 hashfunc = hashlib.sha256
 
+# NIST P-256 domain parameters (y^2 = x^3 + Ax + B mod P), as defined in FIPS 186-4.
+NIST256_P = 0xFFFFFFFF00000001000000000000000000000000FFFFFFFFFFFFFFFFFFFFFFFF
+NIST256_A = NIST256_P - 3
+NIST256_B = 0x5AC635D8AA3A93E7B3EBBD55769886BC651D06B0CC53B0F63BCE3C3E27D2604B
+
 def _decompress_ed25519(pubkey):
     """Load public key from the serialized blob (stripping the prefix byte)."""
     if pubkey[:1] in {b'\x00', b'\x01'}:
         # set by Trezor fsm_msgSignIdentity() and fsm_msgGetPublicKey()
+        import nacl.signing
         return nacl.signing.VerifyKey(pubkey[1:], encoder=nacl.encoding.RawEncoder)
     else:
         return None
 
+@caching.memoize(size=1024)
 def _decompress_nist256(pubkey):
     """
     Load public key from the serialized blob.
@@ -46,22 +51,32 @@ def _decompress_nist256(pubkey):
     the y-coordinate from the specified x-coordinate. See bitcoin/main.py#L198
     (from https://github.com/vbuterin/pybitcointools/) for details.
     """
-    if pubkey[:1] in {b'\x02', b'\x03'}:  # set by ecdsa_get_public_key33()
-        curve = ecdsa.NIST256p
-        P = curve.curve.p()
-        A = curve.curve.a()
-        B = curve.curve.b()
-        x = util.bytes2num(pubkey[1:33])
-        beta = pow(int(x * x * x + A * x + B), int((P + 1) // 4), int(P))
-
-        p0 = util.bytes2num(pubkey[:1])
-        y = (P - beta) if ((beta + p0) % 2) else beta
-
-        point = ecdsa.ellipticcurve.Point(curve.curve, x, y)
-        return ecdsa.VerifyingKey.from_public_point(point, curve=curve,
-                                                    hashfunc=hashfunc)
-    else:
+    point = _nist256_point(bytes(pubkey))
+    if point is None:
         return None
+    import ecdsa  # only needed for NIST256 keys
+    curve = ecdsa.NIST256p
+    point = ecdsa.ellipticcurve.Point(curve.curve, *point)
+    return ecdsa.VerifyingKey.from_public_point(point, curve=curve,
+                                                hashfunc=hashfunc)
+
+@caching.memoize(size=1024)
+def _nist256_point(pubkey):
+    """Return the (x, y) coordinates of a compressed NIST256 key, or None if invalid."""
+    if len(pubkey) != 33 or pubkey[:1] not in {b'\x02', b'\x03'}:  # ecdsa_get_public_key33()
+        return None
+    P = NIST256_P
+    x = util.bytes2num(pubkey[1:33])
+    if x >= P:
+        return None
+    rhs = (x * x * x + NIST256_A * x + NIST256_B) % P
+    beta = pow(rhs, (P + 1) // 4, P)
+    if beta * beta % P != rhs:
+        return None  # x is not on the curve
+
+    p0 = pubkey[0]
+    y = (P - beta) if ((beta + p0) % 2) else beta
+    return x, y
 
 def decompress_pubkey(pubkey, curve_name):
     """
@@ -76,7 +91,7 @@ def decompress_pubkey(pubkey, curve_name):
             CURVE_ED25519: _decompress_ed25519,
             ECDH_CURVE25519: _decompress_ed25519,
         }[curve_name]
-        vk = decompress(pubkey)
+        vk = decompress(bytes(pubkey))
 
     if not vk:
         msg = 'invalid {!s} public key: {!r}'.format(curve_name, pubkey)
@@ -84,6 +99,33 @@ def decompress_pubkey(pubkey, curve_name):
 
     return vk
 
+def decode_pubkey(pubkey, curve_name):
+    """
+    Return the raw public key of a serialized blob, without building key objects.
+
+    Ed25519 and Curve25519 keys are returned as their 32 bytes, NIST256 keys as
+    their 65-byte uncompressed encoding. Raise ValueError on parsing error.
+    """
+    if len(pubkey) == 33:
+        if curve_name in {CURVE_ED25519, ECDH_CURVE25519}:
+            if pubkey[0] in {0, 1}:
+                return bytes(pubkey[1:])
+        elif curve_name == CURVE_NIST256:
+            point = _nist256_point(bytes(pubkey))
+            if point is not None:
+                return b'\x04' + util.num2bytes(point[0], 32) + util.num2bytes(point[1], 32)
+        else:
+            raise KeyError(curve_name)
+    msg = 'invalid {!s} public key: {!r}'.format(curve_name, pubkey)
+    raise ValueError(msg)
+
+def decode_pubkeys(pubkeys, curve_name):
+    """Return the raw public keys of many serialized blobs, see decode_pubkey()."""
+    if curve_name in {CURVE_ED25519, ECDH_CURVE25519}:
+        if all(len(pubkey) == 33 and pubkey[0] in {0, 1} for pubkey in pubkeys):
+            return [bytes(pubkey[1:]) for pubkey in pubkeys]
+    return [decode_pubkey(pubkey, curve_name) for pubkey in pubkeys]
+
 def get_ecdh_curve_name(signature_curve_name):
     """Return appropriate curve for ECDH for specified signing curve."""
     return {
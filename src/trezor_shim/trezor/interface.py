@@ -1,15 +1,12 @@
 import hashlib
-import io
-import logging
 import re
 import struct
 
-import unidecode
-
+from . import caching
 from . import formats
-from . import util
+from . import logs
 
-log = logging.getLogger(__name__)
+log = logs.device_logger(__name__)
 
 _identity_regexp = re.compile(''.join([
     '^'
@@ -53,6 +50,28 @@ class NotFoundError(Error):
 class DeviceError(Error):
     """Error during device operation."""
 
+def transliterate(s):
+    """Transliterate Unicode into ASCII, skipping the lookup for ASCII strings."""
+    if s.isascii():
+        return s
+    import unidecode
+    return unidecode.unidecode(s)
+
+@caching.memoize(size=4096)
+def bip32_address(blob, index=0, ecdh=False):
+    """Compute (and remember) the SLIP-0013/0017 BIP32 address of a serialized identity."""
+    digest = hashlib.sha256(struct.pack('<L', index) + blob).digest()
+    hardened = 0x80000000
+    addr_0 = 17 if bool(ecdh) else 13
+    return (hardened | addr_0,) + tuple(hardened | value
+                                        for value in struct.unpack_from('<LLLL', digest))
+
+def signify_addresses(stem, pidx, kidx, count, ecdh=False):
+    """Compute the BIP32 addresses of keys `signify://{stem}-{pidx}-{kidx}` onwards."""
+    prefix = transliterate('signify://{}-{}-'.format(stem, pidx))
+    return [list(bip32_address('{}{}'.format(prefix, k).encode('ascii'), 0, ecdh))
+            for k in range(kidx, kidx + count)]
+
 class Identity:
     """Represent SLIP-0013 identity, together with a elliptic curve choice."""
 
@@ -61,15 +80,23 @@ class Identity:
         self.identity_dict = string_to_identity(identity_str)
         self.curve_name = curve_name
 
+    @classmethod
+    def from_parts(cls, curve_name, **parts):
+        """Build an identity from its proto/user/host/port/path parts, without parsing."""
+        identity = cls.__new__(cls)
+        identity.identity_dict = {k: v for k, v in parts.items() if v}
+        identity.curve_name = curve_name
+        return identity
+
     def items(self):
         """Return a copy of identity_dict items."""
-        return [(k, unidecode.unidecode(v))
+        return [(k, transliterate(v))
                 for k, v in self.identity_dict.items()]
 
     def to_bytes(self):
         """Transliterate Unicode into ASCII."""
         s = identity_to_string(self.identity_dict)
-        return unidecode.unidecode(s).encode('ascii')
+        return transliterate(s).encode('ascii')
 
     def to_string(self):
         """Return identity serialized to string."""
@@ -77,16 +104,7 @@ class Identity:
 
     def get_bip32_address(self, ecdh=False):
         """Compute BIP32 derivation address according to SLIP-0013/0017."""
-        index = struct.pack('<L', self.identity_dict.get('index', 0))
-        addr = index + self.to_bytes()
-        log.debug('bip32 address string: %r', addr)
-        digest = hashlib.sha256(addr).digest()
-        s = io.BytesIO(bytearray(digest))
-
-        hardened = 0x80000000
-        addr_0 = 17 if bool(ecdh) else 13
-        address_n = [addr_0] + list(util.recv(s, '<LLLL'))
-        return [(hardened | value) for value in address_n]
+        return list(bip32_address(self.to_bytes(), self.identity_dict.get('index', 0), ecdh))
 
     def get_curve_name(self, ecdh=False):
         """Return correct curve name for device operations."""
@@ -0,0 +1,141 @@
+"""
+Debug logging for the device path: deferred, redacted and optionally rate limited.
+
+Device calls run once per signature, so their debug records must cost
+nothing when debug logging is off (callers check log.isEnabledFor() before
+building them), and little when it is on:
+
+* arguments are wrapped with lazy(), and only computed when a record is
+  actually formatted by a handler;
+* payloads (KERI events, signatures, keys) are logged as payload(), their
+  size and a short digest, never as raw bytes;
+* RateLimit keeps at most `rate` records per second and per message, and
+  optionally only one in `sample` of them, counting what it dropped.
+
+device_logger() loggers are only limited when $TREZOR_SHIM_LOG_RATE
+(records per second, 0 for unlimited) or $TREZOR_SHIM_LOG_SAMPLE is set.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from . import caching
+from . import metrics
+
+
+class Lazy:
+    """Log argument computed by `func(*args)` when formatted, at most once."""
+
+    __slots__ = ('func', 'args', 'value')
+
+    def __init__(self, func, *args):
+        """C-tor."""
+        self.func = func
+        self.args = args
+        self.value = None
+
+    def __str__(self):
+        if self.func is not None:
+            self.value = self.func(*self.args)
+            self.func = self.args = None
+        return str(self.value)
+
+    __repr__ = __str__
+
+
+def lazy(func, *args):
+    """Defer `func(*args)` until the record using it is formatted."""
+    return Lazy(func, *args)
+
+
+class Payload:
+    """Log argument describing a blob by its size and digest, e.g. `<183 bytes 3f9a0c1e2b4d>`."""
+
+    __slots__ = ('blob',)
+
+    def __init__(self, blob):
+        """C-tor."""
+        self.blob = blob
+
+    def __str__(self):
+        if self.blob is None:
+            return '<none>'
+        return '<{} bytes {}>'.format(len(self.blob), hashlib.sha256(self.blob).hexdigest()[:12])
+
+    __repr__ = __str__
+
+
+def payload(blob):
+    """Describe `blob` in a log record, without its content."""
+    return Payload(blob)
+
+
+class RateLimit(logging.Filter):
+    """
+    Logger filter keeping at most `rate` records per second of each message.
+
+    With `sample`, only the first of every `sample` records of a message is
+    considered. Records above `level` always pass. The next record kept after
+    some were dropped mentions how many, and drops are also counted in
+    `trezor_shim_log_suppressed_total`.
+    """
+
+    def __init__(self, rate=None, sample=1, level=logging.DEBUG, timer=time.monotonic):
+        """C-tor; a `rate` of None or 0 keeps every sampled record."""
+        super().__init__()
+        self.rate = rate or None
+        self.burst = max(self.rate, 1.0) if self.rate else None
+        self.sample = max(int(sample), 1)
+        self.level = level
+        self.timer = timer
+        self.lock = threading.Lock()
+        self.states = caching.LRUCache(size=256)  # message -> [tokens, last refill, seen, dropped]
+
+    def filter(self, record):
+        """True if `record` should be emitted."""
+        if record.levelno > self.level:
+            return True
+        with self.lock:
+            state = self.states.get(record.msg)
+            if state is None:
+                state = self.states.put(record.msg, [self.burst, self.timer(), 0, 0])
+            state[2] += 1
+            keep = (state[2] - 1) % self.sample == 0
+            if keep and self.rate is not None:
+                now = self.timer()
+                state[0] = min(self.burst, state[0] + (now - state[1]) * self.rate)
+                state[1] = now
+                keep = state[0] >= 1
+                if keep:
+                    state[0] -= 1
+            if not keep:
+                state[3] += 1
+                dropped = 0
+            else:
+                dropped, state[3] = state[3], 0
+        if not keep:
+            metrics.inc('trezor_shim_log_suppressed_total', logger=record.name)
+        elif dropped:
+            record.msg = '{} [{} similar suppressed]'.format(record.msg, dropped)
+        return keep
+
+
+def limit(logger, rate=None, sample=1):
+    """Install a RateLimit on `logger`, replacing any previous one, and return it."""
+    for old in [f for f in logger.filters if isinstance(f, RateLimit)]:
+        logger.removeFilter(old)
+    rate_limit = RateLimit(rate=rate, sample=sample)
+    logger.addFilter(rate_limit)
+    return rate_limit
+
+
+def device_logger(name):
+    """Return the logger `name`, rate limited if the environment asks for it."""
+    logger = logging.getLogger(name)
+    rate = os.environ.get('TREZOR_SHIM_LOG_RATE')
+    sample = os.environ.get('TREZOR_SHIM_LOG_SAMPLE')
+    if rate or sample:
+        limit(logger, rate=float(rate or 0), sample=int(sample or 1))
+    return logger
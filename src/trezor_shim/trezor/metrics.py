@@ -0,0 +1,174 @@
+"""Counters and latency histograms for device operations."""
+import bisect
+import contextlib
+import threading
+import time
+
+# Latency buckets (in seconds), from a USB exchange to a PIN prompt.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Name: (type, help) of every metric recorded by this package.
+METRICS = {
+    'trezor_shim_device_seconds':
+        ('histogram', 'Latency of device phases, such as find_device, unlock or sign_identity.'),
+    'trezor_shim_operation_seconds':
+        ('histogram', 'Latency of shim operations, such as incept, rotate or sign.'),
+    'trezor_shim_connect_retries_total':
+        ('counter', 'Connection attempts retried after a PIN failure.'),
+    'trezor_shim_reconnects_total':
+        ('counter', 'Sessions reopened after the device dropped.'),
+    'trezor_shim_keepalive_total':
+        ('counter', 'Keepalive ticks, by result (ping, busy, lost, connect, reconnect, absent).'),
+    'trezor_shim_failovers_total':
+        ('counter', 'Pooled calls retried on another device.'),
+    'trezor_shim_verify_seconds':
+        ('histogram', 'Latency of checking one device signature on the host.'),
+    'trezor_shim_verify_failures_total':
+        ('counter', 'Device signatures failing host verification.'),
+    'trezor_shim_ecdh_cache_total':
+        ('counter', 'ECDH session key cache lookups and evictions, by result.'),
+    'trezor_shim_log_suppressed_total':
+        ('counter', 'Debug records dropped by rate limiting or sampling, by logger.'),
+    'trezor_shim_key_cache_total':
+        ('counter', 'Verification key cache lookups and evictions, by result.'),
+}
+
+
+class Histogram:
+    """Cumulative latency histogram."""
+
+    def __init__(self, buckets=BUCKETS):
+        """C-tor."""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """Record one observation."""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """In-memory store of counters and histograms, keyed by name and labels."""
+
+    def __init__(self, buckets=BUCKETS):
+        """C-tor."""
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, amount=1, **labels):
+        """Increment counter `name`."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Record `value` in histogram `name`."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def value(self, name, **labels):
+        """Return the current value of counter `name`."""
+        with self.lock:
+            return self.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def exposition(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            lines = []
+            described = set()
+            for (name, labels), value in counters:
+                _describe(lines, described, name, 'counter')
+                lines.append('{}{} {}'.format(name, _labels(labels), value))
+            for (name, labels), histogram in histograms:
+                _describe(lines, described, name, 'histogram')
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', le),)),
+                                                         cumulative))
+                lines.append('{}_sum{} {}'.format(name, _labels(labels), histogram.sum))
+                lines.append('{}_count{} {}'.format(name, _labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+class NullRegistry:
+    """Registry discarding everything, to turn instrumentation off."""
+
+    def inc(self, name, amount=1, **labels):
+        """Ignore the increment."""
+
+    def observe(self, name, value, **labels):
+        """Ignore the observation."""
+
+    def value(self, name, **labels):
+        """Nothing is recorded."""
+        return 0
+
+    def exposition(self):
+        """Nothing to expose."""
+        return ''
+
+
+def _describe(lines, described, name, kind):
+    if name not in described:
+        described.add(name)
+        kind, text = METRICS.get(name, (kind, name))
+        lines.append('# HELP {} {}'.format(name, text))
+        lines.append('# TYPE {} {}'.format(name, kind))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, _escape(value)) for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+registry = Registry()
+
+
+def set_registry(new_registry):
+    """Record metrics into `new_registry` (e.g. a NullRegistry, or an adapter) from now on."""
+    global registry  # pylint: disable=global-statement
+    registry = new_registry
+
+
+def inc(name, amount=1, **labels):
+    """Increment counter `name` in the current registry."""
+    registry.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    """Record `value` in histogram `name` of the current registry."""
+    registry.observe(name, value, **labels)
+
+
+@contextlib.contextmanager
+def timer(name, **labels):
+    """Time the enclosed block into histogram `name` of the current registry."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+def exposition():
+    """Render the current registry in the Prometheus text exposition format."""
+    return registry.exposition()
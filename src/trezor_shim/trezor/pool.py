@@ -0,0 +1,161 @@
+"""Pool of devices restored from the same seed."""
+import collections
+import logging
+import threading
+
+from . import actors
+from . import interface
+from . import metrics
+from . import sessions
+
+log = logging.getLogger(__name__)
+
+# Failures after which a call is retried on another device of the pool.
+RETRIES = (interface.DeviceError, interface.NotFoundError) + sessions.DISCONNECTS
+
+
+class Pool:
+    """
+    Sessions to several devices holding the same seed.
+
+    Exposes the same interface as `sessions.Session`. Each call goes to the
+    live device with the least outstanding requests, and is retried on
+    another device when one fails or disconnects. Devices whose seed
+    fingerprint differs from the pool's (the one seen first, else the one of
+    the majority of the devices) are dropped from the pool.
+    """
+
+    def __init__(self, members):
+        """C-tor."""
+        self.members = list(members)
+        self.lock = threading.RLock()
+        self.users = 0
+        self.held = []
+        self.live = []
+        self.excluded = []  # members deriving a different seed
+        self.load = {}
+        self.session_ids = {}  # id(member) -> session id its fingerprint was checked in
+        self.seed = None  # fingerprint the pool settled on, kept across reconnects
+        self._fingerprint = None
+
+    @classmethod
+    def discover(cls, factory, idle_timeout=0.0, threaded=False):
+        """
+        Create a pool over every connected device, using `factory(path)` to create them.
+
+        With `threaded`, each device is owned by its own `actors.DeviceActor`.
+        """
+        from trezorlib.transport import enumerate_devices
+        paths = [transport.get_path() for transport in enumerate_devices()]
+        if not paths:
+            raise interface.NotFoundError('no devices connected')
+        log.debug('pooling devices: %s', paths)
+        members = [sessions.Session(factory(path), idle_timeout=idle_timeout) for path in paths]
+        if threaded:
+            members = [actors.DeviceActor(member) for member in members]
+        return cls(members)
+
+    @property
+    def width(self):
+        """Number of devices serving calls concurrently."""
+        return max(len(self.live), 1)
+
+    @property
+    def fingerprint(self):
+        """Seed fingerprint shared by the pooled devices, derived once they are connected."""
+        with self, self.lock:
+            if self._fingerprint is None:
+                self._fingerprint = self._probe()
+            return self._fingerprint
+
+    def acquire(self):
+        """Hold every reachable device open."""
+        with self.lock:
+            if self.users == 0:
+                for member in self.members:
+                    try:
+                        self.held.append(member.acquire())
+                    except Exception as e:  # pylint: disable=broad-except
+                        log.warning('skipping %s: %s', member.device, e)
+                        continue
+                    if member in self.excluded:
+                        continue
+                    session_id = getattr(member.device.conn, 'session_id', None)
+                    if session_id is None or self.session_ids.get(id(member)) != session_id:
+                        self._fingerprint = None  # a new session may hold another seed
+                self.live = [member for member in self.held if member not in self.excluded]
+                if not self.live:
+                    self._release_held()
+                    raise interface.NotFoundError('no pooled device available')
+            self.users += 1
+        return self
+
+    def release(self):
+        """Drop a hold on the pool, releasing the devices once idle."""
+        with self.lock:
+            self.users -= 1
+            if self.users == 0:
+                self._release_held()
+
+    def call(self, method, *args, **kwargs):
+        """Run a device method on the least loaded device, failing over on errors."""
+        with self:
+            tried = []
+            while True:
+                member = self._pick(tried)
+                try:
+                    return member.call(method, *args, **kwargs)
+                except RETRIES as e:
+                    if len(tried) + 1 >= len(self.live):
+                        raise
+                    log.warning('%s failed (%s), retrying on another device', member.device, e)
+                    metrics.inc('trezor_shim_failovers_total')
+                    tried.append(member)
+                finally:
+                    with self.lock:
+                        self.load[id(member)] -= 1
+
+    def close(self):
+        """Close every pooled device connection."""
+        with self.lock:
+            self._fingerprint = None
+            for member in self.members:
+                member.close()
+
+    def _pick(self, tried):
+        with self.lock:
+            candidates = [member for member in self.live if member not in tried]
+            member = min(candidates, key=lambda m: self.load.get(id(m), 0))
+            self.load[id(member)] = self.load.get(id(member), 0) + 1
+            return member
+
+    def _probe(self):
+        fingerprints = {id(member): member.call('fingerprint') for member in self.live}
+        counts = collections.Counter(fingerprints.values())
+        expected = self.seed
+        if expected not in counts:
+            (expected, count), = counts.most_common(1)
+            if count * 2 <= len(self.live):
+                raise interface.DeviceError('pooled devices disagree on the seed: {}'.format(
+                    ', '.join(str(member.device) for member in self.live)))
+        for member in self.live:
+            self.session_ids[id(member)] = getattr(member.device.conn, 'session_id', None)
+            if fingerprints[id(member)] != expected:
+                log.error('%s derives a different seed, dropping it from the pool', member.device)
+                self.excluded.append(member)
+        self.live = [member for member in self.live if member not in self.excluded]
+        self.seed = expected
+        return expected
+
+    def _release_held(self):
+        held, self.held, self.live = self.held, [], []
+        for member in held:
+            member.release()
+
+    def __enter__(self):
+        """Allow usage as context manager."""
+        return self.acquire()
+
+    def __exit__(self, *args):
+        """Release the hold taken by __enter__."""
+        self.release()
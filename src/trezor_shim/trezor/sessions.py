@@ -0,0 +1,240 @@
+"""Long-lived device sessions shared across operations."""
+import functools
+import logging
+import threading
+from concurrent import futures
+
+from trezorlib.transport import TransportException
+
+from . import interface
+from . import metrics
+
+try:
+    from usb1 import USBError
+except ImportError:
+    USBError = OSError
+
+log = logging.getLogger(__name__)
+
+# Errors raised when the device was unplugged or the USB handle went stale.
+DISCONNECTS = (TransportException, USBError, OSError, EOFError)
+
+
+class Session:
+    """
+    Connection to a device kept open across operations.
+
+    The device is connected on first use and closed once no caller holds
+    the session any more and it has been idle for `idle_timeout` seconds.
+    A timeout of 0 closes the connection as soon as the last caller leaves,
+    `float('inf')` keeps it open until `close()` is called.
+    """
+
+    width = 1  # number of devices serving calls concurrently
+
+    def __init__(self, device, idle_timeout=0.0):
+        """C-tor."""
+        self.device = device
+        self.idle_timeout = float(idle_timeout)
+        self.lock = threading.RLock()
+        self.users = 0
+        self.timer = None
+        self.dispatch = lambda fn: fn()  # runs idle expiry; a DeviceActor routes it to its worker
+        self.keepalive = None
+        self._fingerprint = None
+
+    @property
+    def connected(self):
+        """True if the device connection is open."""
+        return self.device.conn is not None
+
+    @property
+    def fingerprint(self):
+        """Seed fingerprint of the connected device, derived once per connection."""
+        with self, self.lock:
+            if self._fingerprint is None:
+                self._fingerprint = self.call('fingerprint')
+            return self._fingerprint
+
+    def acquire(self):
+        """Hold the session open, connecting to the device if needed."""
+        with self.lock:
+            self._cancel_timer()
+            self.users += 1
+            try:
+                if not self.connected:
+                    self.connect()
+            except Exception:
+                self.users -= 1
+                raise
+        return self
+
+    def release(self):
+        """Drop a hold on the session, closing it once idle."""
+        with self.lock:
+            self.users -= 1
+            if self.users > 0:
+                return
+            if self.idle_timeout <= 0:
+                self.close()
+            elif self.idle_timeout != float('inf'):
+                timer = threading.Timer(self.idle_timeout, self.dispatch)
+                timer.args = (functools.partial(self._expire, timer),)
+                timer.daemon = True
+                timer.start()
+                self.timer = timer
+
+    def call(self, method, *args, **kwargs):
+        """Run a device method, reconnecting once if the device dropped."""
+        with self, self.lock:
+            try:
+                return getattr(self.device, method)(*args, **kwargs)
+            except DISCONNECTS as e:
+                log.warning('%s disconnected (%s), reconnecting', self.device, e)
+                metrics.inc('trezor_shim_reconnects_total')
+                self.reconnect()
+            return getattr(self.device, method)(*args, **kwargs)
+
+    def connect(self):
+        """Open the device connection."""
+        with self.lock:
+            self.device.__enter__()
+            if not self.connected:
+                raise interface.DeviceError('{} could not be unlocked'.format(self.device))
+            log.debug('%s session opened', self.device)
+
+    def warm(self):
+        """Connect if needed and derive the seed fingerprint, without holding the session."""
+        with self.lock:
+            if not self.connected:
+                self.connect()
+            if self._fingerprint is None:
+                self._fingerprint = self.device.fingerprint()
+
+    def reconnect(self):
+        """Drop a stale connection and open a fresh one."""
+        with self.lock:
+            self.close()
+            self.connect()
+
+    def close(self):
+        """Close the device connection, if open."""
+        with self.lock:
+            self._cancel_timer()
+            self._fingerprint = None
+            if self.connected:
+                self.device.__exit__(None, None, None)
+                log.debug('%s session closed', self.device)
+
+    def _expire(self, timer):
+        with self.lock:
+            if self.users == 0 and self.timer is timer:
+                self.timer = None
+                log.debug('%s idle for %ss', self.device, self.idle_timeout)
+                self.close()
+
+    def _cancel_timer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def __enter__(self):
+        """Allow usage as context manager."""
+        return self.acquire()
+
+    def __exit__(self, *args):
+        """Release the hold taken by __enter__."""
+        self.release()
+
+
+class Keepalive:
+    """
+    Background thread keeping an idle session connected and unlocked.
+
+    Every `interval` seconds, a session nobody holds exchanges a Ping with
+    its device. A device that stopped answering (e.g. was unplugged) is
+    closed right away, and a closed session is connected again as soon as
+    its device is back, so that the next operation finds it warm. Ticks run
+    through the session's dispatch, i.e. on the worker of a DeviceActor.
+    Shims sharing a session share its keepalive, which runs until the last
+    of them stops it.
+    """
+
+    def __init__(self, session, interval):
+        """C-tor."""
+        self.session = session
+        self.interval = float(interval)
+        self.stopped = threading.Event()
+        self.thread = None
+        self.holders = 0  # attach() calls not matched by a stop() yet
+        self.lock = threading.Lock()
+
+    @classmethod
+    def attach(cls, session, interval):
+        """Start the keepalive of `session`, or hold its running one; stop() it once done."""
+        with session.lock:
+            if session.keepalive is None or session.keepalive.thread is None:
+                session.keepalive = cls(session, interval)
+                session.keepalive.start()
+            keepalive = session.keepalive
+            with keepalive.lock:
+                keepalive.holders += 1
+            return keepalive
+
+    def start(self):
+        """Start pinging, connecting the session right away."""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self._run, name='{}-keepalive'.format(
+            self.session.device), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Drop a hold taken by attach(); the last one stops pinging, leaving the session as it is."""
+        with self.lock:
+            self.holders = max(self.holders - 1, 0)
+            if self.holders:
+                return
+            self.stopped.set()
+            thread, self.thread = self.thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def tick(self):
+        """Ping or connect the session once, if idle; return what was done."""
+        result = self.session.dispatch(self._tick)
+        return result.result() if isinstance(result, futures.Future) else result
+
+    def _run(self):
+        while not self.stopped.is_set():
+            try:
+                self.tick()
+            except Exception as e:  # pylint: disable=broad-except
+                log.warning('%s keepalive failed: %s', self.session.device, e)
+            self.stopped.wait(self.interval)
+
+    def _tick(self):
+        session = self.session
+        with session.lock:
+            if self.stopped.is_set():
+                return None
+            if session.users:
+                return 'busy'  # in use, hence alive
+            result = None
+            if session.connected:
+                try:
+                    with metrics.timer('trezor_shim_device_seconds', phase='ping'):
+                        session.device.ping()
+                    result = 'ping'
+                except DISCONNECTS + (interface.Error,) as e:
+                    log.warning('%s stopped answering (%s)', session.device, e)
+                    session.close()
+                    result = 'lost'
+            if not session.connected:
+                try:
+                    session.warm()
+                    result = 'reconnect' if result == 'lost' else 'connect'
+                except DISCONNECTS + (interface.Error,) as e:
+                    log.debug('%s not available: %s', session.device, e)
+                    result = result or 'absent'
+        metrics.inc('trezor_shim_keepalive_total', result=result)
+        return result
@@ -1,28 +1,38 @@
 import binascii
+import collections
+import hashlib
 import logging
-import semver
 import os
 
-import semver
-from trezorlib.btc import get_address, get_public_node
-from trezorlib.client import PASSPHRASE_TEST_PATH
-from trezorlib.client import TrezorClient as Client
-from trezorlib.exceptions import PinException, TrezorFailure
-from trezorlib.messages import IdentityType
-from trezorlib.misc import get_ecdh_session_key, sign_identity
-from trezorlib.transport import get_transport
-
+from . import caching
 from . import formats
 from . import interface
+from . import logs
+from . import metrics
+
+log = logs.device_logger(__name__)
 
-log = logging.getLogger(__name__)
+# Session unlocked by a full handshake on a device, and what was learned about it.
+KnownSession = collections.namedtuple('KnownSession', 'version session_id fingerprint')
+
+# Oldest firmware reporting session ids, per major version (older ones cannot resume).
+SESSION_ID_VERSIONS = {1: (1, 9, 0), 2: (2, 3, 0)}
 
 class Trezor():
 
     required_version = '>=1.4.0'
 
     ui = None  # can be overridden by device's users
-    cached_session_id = None
+    probe_key_id = 'trezor_shim-probe'  # identity used to fingerprint the seed
+
+    # shared by all instances
+    known_sessions = caching.LRUCache(size=64)  # device_id -> KnownSession
+    known_paths = caching.LRUCache(size=64)  # transport path -> device_id
+
+    @property
+    def _defs(self):
+        from . import trezor_defs
+        return trezor_defs
 
     def verify_version(self, connection):
         f = connection.features
@@ -34,6 +44,7 @@ class Trezor():
                                             f.patch_version)
         log.debug('version  : %s', current_version)
         log.debug('revision : %s', binascii.hexlify(f.revision))
+        import semver
         if not semver.match(current_version, self.required_version):
             fmt = ('Please upgrade your {} firmware to {} version'
                    ' (current: {})')
@@ -41,24 +52,42 @@ class Trezor():
                                         current_version))
 
     def connect(self):
-        transport = self.find_device()
+        with metrics.timer('trezor_shim_device_seconds', phase='find_device'):
+            transport = self.find_device()
         if not transport:
             raise interface.NotFoundError('{} not connected'.format(self))
 
         log.debug('using transport: %s', transport)
-        for _ in range(5):  # Retry a few times in case of PIN failures
-            connection = Client(transport=transport,
-                                           ui=self.ui,
-                                           session_id=self.__class__.cached_session_id)
-            self.verify_version(connection)
+        path = transport.get_path()
+        session_id = self.cached_session_id
+        if session_id is None:  # another instance may have unlocked this device already
+            known = self.known_sessions.get(self.known_paths.get(path))
+            session_id = known.session_id if known else None
+        for attempt in range(5):  # Retry a few times in case of PIN failures
+            if attempt:
+                metrics.inc('trezor_shim_connect_retries_total')
+            with metrics.timer('trezor_shim_device_seconds', phase='initialize'):
+                connection = self._defs.Client(transport=transport,
+                                               ui=self.ui,
+                                               session_id=session_id)
+            if self._resumed(connection, session_id):
+                log.debug('resumed session on %s', connection.features.device_id)
+                connection.open()  # keep the transport open until close()
+                return connection
+
+            with metrics.timer('trezor_shim_device_seconds', phase='verify_version'):
+                self.verify_version(connection)
 
             try:
                 # unlock PIN and passphrase
-                get_address(connection,
-                                       "Testnet",
-                                       PASSPHRASE_TEST_PATH)
+                with metrics.timer('trezor_shim_device_seconds', phase='unlock'):
+                    self._defs.get_address(connection,
+                                           "Testnet",
+                                           self._defs.PASSPHRASE_TEST_PATH)
+                self._remember(connection, path)
+                connection.open()  # keep the transport open until close()
                 return connection
-            except (PinException, ValueError) as e:
+            except (self._defs.PinException, ValueError) as e:
                 log.error('Invalid PIN: %s, retrying...', e)
                 continue
             except Exception as e:
@@ -67,10 +96,24 @@ class Trezor():
                 raise
         return None
 
-    def close(self):
-        """Close connection."""
-        self.__class__.cached_session_id = self.conn.session_id
-        super().close()
+    def _resumed(self, connection, session_id):
+        """True if Initialize resumed a session this process already verified and unlocked."""
+        f = connection.features
+        version = (f.major_version, f.minor_version, f.patch_version)
+        known = self.known_sessions.get(f.device_id)
+        return (session_id is not None
+                and known is not None
+                and known.session_id == session_id == connection.session_id
+                and known.version == version
+                and version >= SESSION_ID_VERSIONS.get(f.major_version, version + (1,))
+                and f.unlocked is not False)
+
+    def _remember(self, connection, path):
+        """Record the firmware version and session id of an unlocked device."""
+        f = connection.features
+        version = (f.major_version, f.minor_version, f.patch_version)
+        self.known_sessions.put(f.device_id, KnownSession(version, connection.session_id, None))
+        self.known_paths.put(path, f.device_id)
 
     def pubkey(self, key_id, ecdh=False):
         """Return public key."""
@@ -78,22 +121,38 @@ class Trezor():
         identity = self._create_identity(key_id)
 
         curve_name = identity.get_curve_name(ecdh=ecdh)
-        log.debug('"%s" getting public key (%s) from %s',
-                  identity.to_string(), curve_name, self)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('"%s" getting public key (%s) from %s',
+                      logs.lazy(identity.to_string), curve_name, self)
         addr = identity.get_bip32_address(ecdh=ecdh)
-        result = get_public_node(
-            self.conn,
-            n=addr,
-            ecdsa_curve_name=curve_name)
-        log.debug('result: %s', result)
+        with metrics.timer('trezor_shim_device_seconds', phase='get_public_node'):
+            result = self._defs.get_public_node(
+                self.conn,
+                n=addr,
+                ecdsa_curve_name=curve_name)
         pubkey = bytes(result.node.public_key)
-        return bytes(formats.decompress_pubkey(pubkey=pubkey, curve_name=identity.curve_name))
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('public key: %s', logs.payload(pubkey))
+        return formats.decode_pubkey(pubkey=pubkey, curve_name=identity.curve_name)
+
+    def ping(self):
+        """Exchange a cheap message with the device, keeping its session alive."""
+        self.conn.ping('keepalive')
+
+    def fingerprint(self):
+        """Return a digest identifying the seed (and passphrase) of the connected device."""
+        device_id = self.conn.features.device_id or ''
+        known = self.known_sessions.get(device_id)
+        if known and known.session_id == self.conn.session_id and known.fingerprint:
+            return known.fingerprint  # same unlocked session, hence same passphrase and seed
+        probe = self.pubkey(key_id=self.probe_key_id, ecdh=False)
+        fingerprint = hashlib.sha256(probe).hexdigest()
+        if known and known.session_id == self.conn.session_id:
+            self.known_sessions.put(device_id, known._replace(fingerprint=fingerprint))
+        return fingerprint
 
     def _identity_proto(self, identity):
-        result = IdentityType()
-        for name, value in identity.items():
-            setattr(result, name, value)
-        return result
+        return identity_proto(tuple(identity.items()))
 
     def sign(self, key_id, blob):
         """Sign given blob and return the signature (as bytes)."""
@@ -104,20 +163,24 @@ class Trezor():
         """Sign given blob and return the signature (as bytes)."""
         identity = self._create_identity(key_id)
         curve_name = identity.get_curve_name(ecdh=False)
-        log.debug('"%s" signing %r (%s) on %s',
-                  identity.to_string(), blob, curve_name, self)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('"%s" signing %s (%s) on %s',
+                      logs.lazy(identity.to_string), logs.payload(blob), curve_name, self)
         try:
-            result = sign_identity(
-                self.conn,
-                identity=self._identity_proto(identity),
-                challenge_hidden=blob,
-                challenge_visual='',
-                ecdsa_curve_name=curve_name)
-            log.debug('result: %s', result)
+            with metrics.timer('trezor_shim_device_seconds', phase='sign_identity'):
+                result = self._defs.sign_identity(
+                    self.conn,
+                    identity=self._identity_proto(identity),
+                    challenge_hidden=blob,
+                    challenge_visual='',
+                    ecdsa_curve_name=curve_name)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('signature: %s by %s',
+                          logs.payload(result.signature), logs.payload(result.public_key))
             assert len(result.signature) == 65
             assert result.signature[:1] == b'\x00'
             return bytes(result.signature[1:]), bytes(result.public_key[1:])
-        except TrezorFailure as e:
+        except self._defs.TrezorFailure as e:
             msg = '{} error: {}'.format(self, e)
             log.debug(msg, exc_info=True)
             raise interface.DeviceError(msg)
@@ -127,18 +190,46 @@ class Trezor():
         session_key, _ = self.ecdh_with_pubkey(identity, pubkey)
         return session_key
 
+    def ecdh_many(self, identity, pubkeys):
+        """Get the shared session keys of `identity` with many peers, in the current session."""
+        session_keys = {}
+        for pubkey in pubkeys:
+            pubkey = bytes(pubkey)
+            if pubkey not in session_keys:
+                session_keys[pubkey] = self.ecdh(identity, pubkey)
+        return [session_keys[bytes(pubkey)] for pubkey in pubkeys]
+
     def ecdh_with_pubkey(self, identity, pubkey):
         """Get shared session key using Elliptic Curve Diffie-Hellman & self public key."""
+        session_id = self.conn.session_id if self.conn is not None else None
+        if self.ecdh_cache is None or session_id is None:
+            return self._ecdh_with_pubkey(identity, pubkey)
+
+        # keys derive from the seed unlocked by this session, hence its id in the key
+        key = (session_id, identity.to_string(), identity.get_curve_name(ecdh=True), bytes(pubkey))
+        with self.ecdh_cache.lock:  # copy before an eviction zeroizes it
+            entry = self.ecdh_cache.get(key)
+            if entry is not None:
+                return bytes(entry[0]), entry[1]
+        session_key, self_pubkey = self._ecdh_with_pubkey(identity, pubkey)
+        self.ecdh_cache.put(key, (bytearray(session_key), self_pubkey))
+        return session_key, self_pubkey
+
+    def _ecdh_with_pubkey(self, identity, pubkey):
         curve_name = identity.get_curve_name(ecdh=True)
-        log.debug('"%s" shared session key (%s) for %r from %s',
-                  identity.to_string(), curve_name, pubkey, self)
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('"%s" shared session key (%s) for %s from %s',
+                      logs.lazy(identity.to_string), curve_name, logs.payload(pubkey), self)
         try:
-            result = get_ecdh_session_key(
-                self.conn,
-                identity=self._identity_proto(identity),
-                peer_public_key=pubkey,
-                ecdsa_curve_name=curve_name)
-            log.debug('result: %s', result)
+            with metrics.timer('trezor_shim_device_seconds', phase='ecdh'):
+                result = self._defs.get_ecdh_session_key(
+                    self.conn,
+                    identity=self._identity_proto(identity),
+                    peer_public_key=pubkey,
+                    ecdsa_curve_name=curve_name)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug('session key of %s bytes, public key: %s',
+                          len(result.session_key), logs.payload(result.public_key))
             assert len(result.session_key) in {65, 33}  # NIST256 or Curve25519
             assert result.session_key[:1] == b'\x04'
             self_pubkey = result.public_key
@@ -146,33 +237,43 @@ class Trezor():
                 self_pubkey = bytes(self_pubkey[1:])
 
             return bytes(result.session_key), self_pubkey
-        except TrezorFailure as e:
+        except self._defs.TrezorFailure as e:
             msg = '{} error: {}'.format(self, e)
             log.debug(msg, exc_info=True)
             raise interface.DeviceError(msg)
 
     def find_device(self):
-        """Selects a transport based on `TREZOR_PATH` environment variable.
+        """Selects a transport based on the device path, or `TREZOR_PATH` environment variable.
             If unset, picks first connected device.
         """
         try:
-            return get_transport(os.environ.get("TREZOR_PATH"), prefix_search=True)
+            return self._defs.get_transport(self.path or os.environ.get("TREZOR_PATH"), prefix_search=True)
         except Exception as e:  # pylint: disable=broad-except
             log.debug("Failed to find a Trezor device: %s", e)
             return None
     def _create_identity(self, key_id):
-        result = interface.Identity(identity_str='signify://', curve_name='ed25519')
-        # result.identity_dict['user'] = key_id
-        result.identity_dict['host'] = key_id
-        return result
+        return interface.Identity.from_parts(curve_name='ed25519', proto='signify', host=key_id)
     
     def __enter__(self):
         """Allow usage as context manager."""
         self.conn = self.connect()
         return self
     
-    def __init__(self):
+    def __init__(self, path=None, ecdh_ttl=None, ecdh_cache_size=256):
+        """
+        C-tor.
+
+        With `ecdh_ttl`, shared session keys are cached for that many seconds
+        per identity and peer key, and zeroized when they leave the cache.
+        """
+        self.path = path
         self.conn = None
+        self.cached_session_id = None  # resumed on the next connect
+        self.ecdh_cache = None
+        if ecdh_ttl:
+            self.ecdh_cache = caching.LRUCache(size=ecdh_cache_size, ttl=ecdh_ttl,
+                                               on_evict=_zeroize,
+                                               metric='trezor_shim_ecdh_cache_total')
 
     def __exit__(self, *args):
         """Close and mark as disconnected."""
@@ -184,9 +285,28 @@ class Trezor():
 
     
     def close(self):
-        """Close connection to device."""
+        """Close connection to device, dropping (and zeroizing) the cached ECDH keys."""
+        if self.ecdh_cache is not None:
+            self.ecdh_cache.clear()
+        self.cached_session_id = self.conn.session_id
         self.conn.close()
 
     def __str__(self):
         """Human-readable representation."""
-        return '{}'.format(self.__class__.__name__)
\ No newline at end of file
+        return '{}'.format(self.__class__.__name__)
+
+
+def _zeroize(_key, entry):
+    """Overwrite the session key of an ECDH cache entry leaving the cache."""
+    session_key = entry[0]
+    session_key[:] = bytes(len(session_key))
+
+
+@caching.memoize(size=4096)
+def identity_proto(items):
+    """Return (and remember) the IdentityType message of identity `items`."""
+    from . import trezor_defs
+    result = trezor_defs.IdentityType()
+    for name, value in items:
+        setattr(result, name, value)
+    return result
@@ -0,0 +1,9 @@
+"""TREZOR-related definitions, imported on first device use."""
+# pylint: disable=unused-import
+from trezorlib.btc import get_address, get_public_node
+from trezorlib.client import PASSPHRASE_TEST_PATH
+from trezorlib.client import TrezorClient as Client
+from trezorlib.exceptions import PinException, TrezorFailure
+from trezorlib.messages import IdentityType
+from trezorlib.misc import get_ecdh_session_key, sign_identity
+from trezorlib.transport import get_transport
@@ -1,17 +1,15 @@
 """UIs for PIN/passphrase entry."""
 
+import functools
 import logging
 import os
 import subprocess
 import sys
 
+from . import agent
+from . import metrics
 from . import util
 
-try:
-    from trezorlib.client import PASSPHRASE_ON_DEVICE
-except ImportError:
-    PASSPHRASE_ON_DEVICE = object()
-
 log = logging.getLogger(__name__)
 
 class UI:
@@ -29,6 +27,9 @@ class UI:
         self.device_name = device_type.__name__
         self.cached_passphrase_ack = util.ExpiringCache(
             seconds=float(config.get('cache_expiry_seconds', 'inf')))
+        # passphrases shared with other processes, see agent.py
+        self.agent = agent.client(config.get('agent'))
+        self.agent_key = 'passphrase/{}'.format(self.device_name)
 
     def get_pin(self, _code=None):
         """Ask the user for (scrambled) PIN."""
@@ -50,12 +51,14 @@ class UI:
         passphrase = None
         if self.cached_passphrase_ack:
             passphrase = self.cached_passphrase_ack.get()
+        if passphrase is None and self.agent:
+            passphrase = self.agent.get(self.agent_key)
         if passphrase is None:
             env_passphrase = os.environ.get("TREZOR_PASSPHRASE")
             if env_passphrase is not None:
                 passphrase = env_passphrase
             elif available_on_device:
-                passphrase = PASSPHRASE_ON_DEVICE
+                passphrase = passphrase_on_device()
             else:
                 passphrase = interact(
                     title='{} passphrase'.format(self.device_name),
@@ -63,6 +66,8 @@ class UI:
                     description=None,
                     binary=self.passphrase_entry_binary,
                     options=self.options_getter())
+                if self.agent:
+                    self.agent.set(self.agent_key, passphrase)
         if self.cached_passphrase_ack:
             self.cached_passphrase_ack.set(passphrase)
         return passphrase
@@ -72,8 +77,27 @@ class UI:
         # XXX: show notification to the user?
 
 
+_PASSPHRASE_ON_DEVICE = object()  # for trezorlib versions without on-device entry
+
+
+def passphrase_on_device():
+    """Return the trezorlib marker asking for passphrase entry on the device."""
+    try:
+        from trezorlib.client import PASSPHRASE_ON_DEVICE
+    except ImportError:
+        return _PASSPHRASE_ON_DEVICE
+    return PASSPHRASE_ON_DEVICE
+
+
 def create_default_options_getter():
-    """Return current TTY and DISPLAY settings for GnuPG pinentry."""
+    """Return a getter of the current TTY and DISPLAY settings for GnuPG pinentry.
+
+    The settings are probed on the first call, i.e. only once a prompt is shown.
+    """
+    return functools.lru_cache(maxsize=None)(_default_options)
+
+
+def _default_options():
     options = []
     if sys.stdin.isatty():  # short-circuit calling `tty`
         try:
@@ -89,7 +113,7 @@ def create_default_options_getter():
         log.info('DISPLAY not defined')
 
     log.info('using %s for pinentry options', options)
-    return lambda: options
+    return options
 
 
 def write(p, line):
@@ -115,6 +139,11 @@ def expect(p, prefixes, confidential=False):
 
 def interact(title, description, prompt, binary, options):
     """Use GPG pinentry program to interact with the user."""
+    with metrics.timer('trezor_shim_device_seconds', phase='pinentry'):
+        return _interact(title, description, prompt, binary, options)
+
+
+def _interact(title, description, prompt, binary, options):
     args = [binary]
     p = subprocess.Popen(args=args,
                          stdin=subprocess.PIPE,
@@ -1,12 +1,15 @@
 """Various I/O and serialization utilities."""
 import binascii
 import contextlib
-import functools
-import io
 import logging
+import os
+import socket
+import stat
 import struct
 import time
 
+from . import caching
+
 log = logging.getLogger(__name__)
 
 
@@ -15,6 +18,23 @@ def send(conn, data):
     conn.sendall(data)
 
 
+def send_frame(conn, *msgs):
+    """Send the frame of `msgs` to connection socket, without joining them when it can scatter-gather."""
+    try:
+        _sendmsg = conn.sendmsg
+    except AttributeError:
+        conn.sendall(frame(*msgs))
+        return
+    parts = [memoryview(pack('L', sum(len(msg) for msg in msgs)))]
+    parts.extend(memoryview(msg) for msg in msgs)
+    while parts:
+        sent = _sendmsg(parts)
+        while parts and sent >= len(parts[0]):
+            sent -= len(parts.pop(0))
+        if sent:
+            parts[0] = parts[0][sent:]
+
+
 def recv(conn, size):
     """
     Receive bytes from connection socket or stream.
@@ -27,23 +47,44 @@ def recv(conn, size):
         size = struct.calcsize(fmt)
     except TypeError:
         fmt = None
+    try:
+        _read_into = conn.recv_into
+    except AttributeError:
+        _read_into = getattr(conn, 'readinto', None)
+
+    if _read_into is None:
+        res = _recv_chunks(conn, size)
+    else:
+        res = bytearray(size)
+        view = memoryview(res)
+        offset = 0
+        while offset < size:
+            count = _read_into(view[offset:])
+            if not count:
+                raise EOFError
+            offset += count
+        res = bytes(res)
+    if fmt:
+        return struct.unpack(fmt, res)
+    else:
+        return res
+
+
+def _recv_chunks(conn, size):
+    """Receive `size` bytes from a connection without readinto() support."""
     try:
         _read = conn.recv
     except AttributeError:
         _read = conn.read
 
-    res = io.BytesIO()
+    chunks = []
     while size > 0:
         buf = _read(size)
         if not buf:
             raise EOFError
         size = size - len(buf)
-        res.write(buf)
-    res = res.getvalue()
-    if fmt:
-        return struct.unpack(fmt, res)
-    else:
-        return res
+        chunks.append(buf)
+    return b''.join(chunks)
 
 
 def read_frame(conn):
@@ -53,19 +94,12 @@ def read_frame(conn):
 
 def bytes2num(s):
     """Convert MSB-first bytes to an unsigned integer."""
-    res = 0
-    for i, c in enumerate(reversed(bytearray(s))):
-        res += c << (i * 8)
-    return res
+    return int.from_bytes(s, 'big')
 
 def num2bytes(value, size):
     """Convert an unsigned integer to MSB-first bytes with specified size."""
-    res = []
-    for _ in range(size):
-        res.append(value & 0xFF)
-        value = value >> 8
-    assert value == 0
-    return bytes(bytearray(list(reversed(res))))
+    assert value >> (size * 8) == 0
+    return value.to_bytes(size, 'big')
 
 def pack(fmt, *args):
     """Serialize MSB-first message."""
@@ -73,28 +107,33 @@ def pack(fmt, *args):
 
 def frame(*msgs):
     """Serialize MSB-first length-prefixed frame."""
-    res = io.BytesIO()
-    for msg in msgs:
-        res.write(msg)
-    msg = res.getvalue()
-    return pack('L', len(msg)) + msg
+    msg = msgs[0] if len(msgs) == 1 else b''.join(msgs)
+    return b''.join([pack('L', len(msg)), msg])
 
-def crc24(blob):
-    """See https://tools.ietf.org/html/rfc4880#section-6.1 for details."""
-    CRC24_INIT = 0x0B704CE
-    CRC24_POLY = 0x1864CFB
+CRC24_INIT = 0x0B704CE
+CRC24_POLY = 0x1864CFB
 
-    crc = CRC24_INIT
-    for octet in bytearray(blob):
-        crc ^= (octet << 16)
+def _crc24_table():
+    """CRC of every octet, for processing a byte per step instead of a bit."""
+    table = []
+    for octet in range(256):
+        crc = octet << 16
         for _ in range(8):
             crc <<= 1
             if crc & 0x1000000:
                 crc ^= CRC24_POLY
-    assert 0 <= crc < 0x1000000
-    crc_bytes = struct.pack('>L', crc)
-    assert crc_bytes[:1] == b'\x00'
-    return crc_bytes[1:]
+        table.append(crc & 0xFFFFFF)
+    return tuple(table)
+
+CRC24_TABLE = _crc24_table()
+
+def crc24(blob):
+    """See https://tools.ietf.org/html/rfc4880#section-6.1 for details."""
+    table = CRC24_TABLE
+    crc = CRC24_INIT
+    for octet in bytes(blob):
+        crc = ((crc << 8) & 0xFFFFFF) ^ table[(crc >> 16) ^ octet]
+    return crc.to_bytes(3, 'big')
 
 def bit(value, i):
     """Extract the i-th bit out of value."""
@@ -133,6 +172,33 @@ def hexlify(blob):
     """Utility for consistent hexadecimal formatting."""
     return binascii.hexlify(blob).decode('ascii').upper()
 
+def same_user(conn):
+    """True if the peer of Unix socket `conn` runs as the current user (where the platform tells)."""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return True  # rely on the permissions of the socket directory
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+    _pid, uid, _gid = struct.unpack('3i', creds)
+    return uid == os.getuid()
+
+def private_dir(path):
+    """Create directory `path` if missing, and check that only the current user can use it."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.lstat(path)  # a symlink may point anywhere
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError('{} is not a directory owned by uid {} with mode 0700'.format(
+            path, os.getuid()))
+
+def private_unix_server(path, factory):
+    """Create the server `factory(path)` on a Unix socket accessible to the current user only."""
+    private_dir(os.path.dirname(path))
+    if os.path.exists(path):
+        os.unlink(path)  # left over by a server that did not exit cleanly
+    umask = os.umask(0o177)
+    try:
+        return factory(path)
+    finally:
+        os.umask(umask)
+
 class Reader:
     """Read basic type objects out of given stream."""
 
@@ -184,38 +250,12 @@ def setup_logging(verbosity, filename=None):
         logging.root.addHandler(hdlr)
 
 def memoize(func):
-    """Simple caching decorator."""
-    cache = {}
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        """Caching wrapper."""
-        key = (args, tuple(sorted(kwargs.items())))
-        if key in cache:
-            return cache[key]
-        else:
-            result = func(*args, **kwargs)
-            cache[key] = result
-            return result
-
-    return wrapper
+    """Caching decorator, keeping the 1024 most recently used results."""
+    return caching.memoize(size=1024)(func)
 
 def memoize_method(method):
-    """Simple caching decorator."""
-    cache = {}
-
-    @functools.wraps(method)
-    def wrapper(self, *args, **kwargs):
-        """Caching wrapper."""
-        key = (args, tuple(sorted(kwargs.items())))
-        if key in cache:
-            return cache[key]
-        else:
-            result = method(self, *args, **kwargs)
-            cache[key] = result
-            return result
-
-    return wrapper
+    """Caching decorator, keeping the 1024 most recently used results of each instance."""
+    return caching.memoize_method(size=1024)(method)
 
 @memoize
 def which(cmd):
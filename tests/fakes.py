@@ -0,0 +1,132 @@
+"""Fake trezorlib transport answering device messages with injected latency."""
+import collections
+import hashlib
+import os
+import time
+
+import nacl.bindings
+import nacl.signing
+from trezorlib import mapping, messages
+from trezorlib.transport import Transport, TransportException
+
+from trezor_shim.trezor import emulator
+from trezor_shim.trezor import interface
+from trezor_shim.trezor import trezor
+
+MNEMONIC = "abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about"
+
+
+class FakeTransport(Transport):
+    """
+    Transport of an emulated Trezor T restored from `MNEMONIC`.
+
+    Each request sleeps for `latency[message name]` seconds before it is
+    answered, and is counted in `counts` by message name.
+    """
+
+    PATH_PREFIX = "fake"
+
+    def __init__(self, latency=None, seed=None, path="fake:0"):
+        self.latency = latency or {}
+        self.seed = seed if seed is not None else emulator.mnemonic_to_seed(MNEMONIC)
+        self.path = path
+        self.device_id = hashlib.sha256(self.seed + path.encode()).hexdigest()[:24].upper()
+        self.counts = collections.Counter()
+        self.sessions = set()
+        self.pending = None
+        self.unplugged = False
+        self.handlers = {
+            messages.Initialize: self.initialize,
+            messages.GetFeatures: self.features,
+            messages.Ping: self.ping,
+            messages.GetAddress: self.get_address,
+            messages.GetPublicKey: self.get_public_key,
+            messages.SignIdentity: self.sign_identity,
+            messages.GetECDHSessionKey: self.get_ecdh_session_key,
+        }
+
+    def get_path(self):
+        return self.path
+
+    def begin_session(self):
+        self.counts["begin_session"] += 1
+
+    def end_session(self):
+        pass
+
+    def write(self, message_type, message_data):
+        if self.unplugged:
+            raise TransportException("device unplugged")
+        msg = mapping.DEFAULT_MAPPING.decode(message_type, message_data)
+        name = msg.__class__.__name__
+        self.counts[name] += 1
+        time.sleep(self.latency.get(name, 0.0))
+        self.pending = mapping.DEFAULT_MAPPING.encode(self.handlers[msg.__class__](msg))
+
+    def read(self):
+        pending, self.pending = self.pending, None
+        return pending
+
+    def reset(self):
+        """Clear the message counters."""
+        self.counts.clear()
+
+    @property
+    def roundtrips(self):
+        """Number of messages answered since the last reset."""
+        return sum(count for name, count in self.counts.items() if name != "begin_session")
+
+    def initialize(self, msg):
+        session_id = msg.session_id if msg.session_id in self.sessions else os.urandom(32)
+        self.sessions.add(session_id)
+        return self.features(msg, session_id=session_id)
+
+    def features(self, _msg, session_id=None):
+        return messages.Features(vendor="trezor.io", model="T", major_version=2, minor_version=6,
+                                 patch_version=0, revision=bytes(20), device_id=self.device_id,
+                                 label="fake", initialized=True, unlocked=True,
+                                 session_id=session_id)
+
+    def ping(self, msg):
+        return messages.Success(message=msg.message)
+
+    def get_address(self, _msg):
+        return messages.Address(address="mvbu1Gdy8SUjTenqerxUaZyYjmvedc787y")
+
+    def get_public_key(self, msg):
+        secret = emulator.derive(self.seed, msg.address_n, msg.ecdsa_curve_name)
+        node = messages.HDNodeType(depth=len(msg.address_n), fingerprint=0, child_num=msg.address_n[-1],
+                                   chain_code=bytes(32),
+                                   public_key=emulator.public_key(secret, msg.ecdsa_curve_name))
+        return messages.PublicKey(node=node, xpub="")
+
+    def sign_identity(self, msg):
+        identity = interface.Identity(identity_str="{}://".format(msg.identity.proto),
+                                      curve_name=msg.ecdsa_curve_name)
+        identity.identity_dict["host"] = msg.identity.host
+        secret = emulator.derive(self.seed, identity.get_bip32_address(), msg.ecdsa_curve_name)
+        signer = nacl.signing.SigningKey(secret)
+        return messages.SignedIdentity(public_key=b"\x00" + bytes(signer.verify_key),
+                                       signature=b"\x00" + signer.sign(msg.challenge_hidden).signature)
+
+    def get_ecdh_session_key(self, msg):
+        identity = interface.Identity(identity_str="{}://".format(msg.identity.proto),
+                                      curve_name="ed25519")
+        identity.identity_dict["host"] = msg.identity.host
+        secret = emulator.derive(self.seed, identity.get_bip32_address(ecdh=True), msg.ecdsa_curve_name)
+        shared = nacl.bindings.crypto_scalarmult(secret, msg.peer_public_key[1:])
+        return messages.ECDHSessionKey(session_key=b"\x04" + shared,
+                                       public_key=emulator.public_key(secret, msg.ecdsa_curve_name))
+
+
+class FakeTrezor(trezor.Trezor):
+    """Trezor talking to a `FakeTransport` instead of USB."""
+
+    def __init__(self, path=None, transport=None, **kwargs):
+        super().__init__(path=path, **kwargs)
+        self.transport = transport
+
+    def find_device(self):
+        if self.transport is None or self.transport.unplugged:
+            return None
+        return self.transport
@@ -0,0 +1,114 @@
+import threading
+import time
+from concurrent import futures
+
+import pytest
+from keri.core import coring
+
+from trezor_shim.core import keeping
+from trezor_shim.trezor import actors
+from trezor_shim.trezor import interface
+from trezor_shim.trezor import sessions
+
+from . import fakes
+
+
+def on_threads(obj, name, threads):
+    """Record the thread every call to `obj.name` runs on."""
+    method = getattr(obj, name)
+
+    def wrapper(*args, **kwargs):
+        threads.add(threading.current_thread())
+        return method(*args, **kwargs)
+
+    setattr(obj, name, wrapper)
+
+
+def test_concurrent_sign(monkeypatch):
+    monkeypatch.setitem(keeping.BACKENDS, "fake", fakes.FakeTrezor)
+    transport = fakes.FakeTransport(latency={"SignIdentity": 0.001})
+    threads = set()
+    on_threads(transport, "write", threads)
+    shim = keeping.TrezorShim(pidx=0, count=2, backend="fake", threaded=True,
+                              idle_timeout=float("inf"), transport=transport)
+    keys, _ = shim.incept()
+
+    sers = [bytes([idx]) * 32 for idx in range(32)]
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        sigs = list(executor.map(lambda ser: shim.sign(ser=ser), sers))
+    for ser, pair in zip(sers, sigs):
+        for key, sig in zip(keys, pair):
+            assert coring.Verfer(qb64=key).verify(coring.Siger(qb64=sig).raw, ser)
+    assert threads == {shim.session.thread}  # only the worker touched the transport
+    assert transport.counts["Initialize"] == 1
+    shim.close()
+    assert shim.session.thread is None  # the last shim out stops the worker
+
+
+def test_idle_expiry_on_worker():
+    device = fakes.FakeTrezor(transport=fakes.FakeTransport())
+    actor = actors.DeviceActor(sessions.Session(device, idle_timeout=0.02))
+    threads = set()
+    on_threads(device, "close", threads)
+
+    assert len(actor.call("pubkey", key_id="stem-0-0")) == 32
+    deadline = time.monotonic() + 5
+    while actor.connected and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert not actor.connected
+    assert threads == {actor.thread}
+    actor.stop()
+
+
+def test_job_exception_reaches_caller():
+    device = fakes.FakeTrezor(transport=fakes.FakeTransport())
+    actor = actors.DeviceActor(sessions.Session(device, idle_timeout=float("inf")))
+
+    def refuse(key_id, blob):
+        raise interface.DeviceError("refused on device")
+
+    device.sign_with_pubkey = refuse
+    future = actor.submit("sign_with_pubkey", key_id="stem-0-0", blob=b"abc")
+    with pytest.raises(interface.DeviceError, match="refused"):
+        future.result(timeout=5)
+    with pytest.raises(interface.DeviceError):
+        actor.call("sign_with_pubkey", key_id="stem-0-0", blob=b"abc")
+    assert len(actor.call("pubkey", key_id="stem-0-0")) == 32  # the worker keeps serving
+    actor.stop()
+
+
+def test_shared_keepalive(monkeypatch):
+    monkeypatch.setitem(keeping.BACKENDS, "fake", fakes.FakeTrezor)
+    transport = fakes.FakeTransport()
+    first, second = [keeping.TrezorShim(pidx=0, backend="fake", threaded=True, keepalive=3600,
+                                        transport=transport) for _ in range(2)]
+    keepalive = second.keepalives[0]
+    assert first.keepalives[0] is keepalive
+
+    first.close()
+    assert keepalive.thread is not None  # still held by the other shim
+    first.close()  # closing twice does not drop the other shim's hold
+    assert keepalive.thread is not None
+    second.close()
+    assert keepalive.thread is None
+
+
+def test_shared_actor_closed_by_last_shim(monkeypatch):
+    monkeypatch.setitem(keeping.BACKENDS, "fake", fakes.FakeTrezor)
+    transport = fakes.FakeTransport()
+    first, second = [keeping.TrezorShim(pidx=0, backend="fake", threaded=True,
+                                        idle_timeout=float("inf"), transport=transport)
+                     for _ in range(2)]
+    actor = second.session
+    assert first.session is actor and actor.owners == 2
+    second.sign(ser=b"abc")
+
+    first.close()
+    assert actor.connected  # the other shim keeps its warm session
+    transport.reset()
+    second.sign(ser=b"abc")
+    assert dict(transport.counts) == {"SignIdentity": 1}
+
+    second.close()
+    assert not actor.connected and actor.thread is None
+    assert actor not in actors.DeviceActor.shared_actors.values()
@@ -0,0 +1,91 @@
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from trezor_shim.trezor import agent
+from trezor_shim.trezor import trezor
+from trezor_shim.trezor import ui
+from trezor_shim.trezor import util
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    server = agent.Agent(ttl=60).bind(str(tmp_path / "agent" / "agent.sock"))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_agent_roundtrip(socket_path):
+    client = agent.Client(socket_path)
+    assert client.get("passphrase/Trezor") is None
+    client.set("passphrase/Trezor", "secret")
+    assert client.get("passphrase/Trezor") == "secret"
+    client.set("short", "lived", ttl=0)
+    assert client.get("short") is None
+    client.clear()
+    assert client.get("passphrase/Trezor") is None
+
+    assert agent.Client(socket_path + ".missing").get("passphrase/Trezor") is None
+
+
+def test_agent_of_another_user(socket_path, monkeypatch):
+    client = agent.Client(socket_path)
+    client.set("passphrase/Trezor", "secret")
+    monkeypatch.setattr(util, "same_user", lambda conn: False)
+    client.set("passphrase/Trezor", "sent to someone else")
+    assert client.get("passphrase/Trezor") is None
+    monkeypatch.undo()
+    assert client.get("passphrase/Trezor") == "secret"
+
+
+def test_malformed_requests(socket_path):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(socket_path)
+        for frame in [b"{not json", b"[]", b'{"op": "get"}', b'{"op": "set", "key": []}']:
+            util.send_frame(conn, frame)
+            assert "error" in json.loads(util.read_frame(conn))
+        util.send_frame(conn, b'{"op": "get", "key": "k"}')
+        assert json.loads(util.read_frame(conn)) == {"value": None}  # still answering
+
+
+def test_unsafe_socket_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        agent.Agent().bind(str(shared / "agent.sock"))
+
+    link = tmp_path / "link"
+    link.symlink_to(tmp_path / "private")
+    (tmp_path / "private").mkdir(mode=0o700)
+    with pytest.raises(PermissionError):
+        agent.Agent().bind(str(link / "agent.sock"))
+
+    if os.getuid() == 0:  # only root may give a directory away
+        foreign = tmp_path / "foreign"
+        foreign.mkdir(mode=0o700)
+        os.chown(foreign, 4242, -1)
+        with pytest.raises(PermissionError):
+            agent.Agent().bind(str(foreign / "agent.sock"))
+    assert not list(tmp_path.glob("*/agent.sock"))
+
+
+def test_shared_passphrase(socket_path, monkeypatch):
+    monkeypatch.delenv("TREZOR_PASSPHRASE", raising=False)
+    monkeypatch.setenv("TREZOR_SHIM_AGENT", socket_path)
+    prompts = []
+    monkeypatch.setattr(ui, "interact", lambda **kwargs: prompts.append(kwargs) or "secret")
+
+    first = ui.UI(trezor.Trezor)
+    assert first.get_passphrase() == "secret"
+    assert len(prompts) == 1
+
+    cold = ui.UI(trezor.Trezor)  # e.g. in another worker process
+    assert cold.get_passphrase() == "secret"
+    assert len(prompts) == 1
@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from concurrent import futures
+
+from trezor_shim.core import keeping
+
+from . import fakes
+
+
+def make_shim(monkeypatch, **kwargs):
+    monkeypatch.setitem(keeping.BACKENDS, "fake", fakes.FakeTrezor)
+    transport = fakes.FakeTransport(latency={"SignIdentity": 0.1})
+    return keeping.AsyncTrezorShim(pidx=0, backend="fake", transport=transport, **kwargs)
+
+
+def test_loop_runs_while_device_works(monkeypatch):
+    shim = make_shim(monkeypatch)
+
+    async def main():
+        ticks = 0
+        task = asyncio.ensure_future(shim.sign(ser=b"abc"))
+        while not task.done():
+            await asyncio.sleep(0.005)
+            ticks += 1
+        await shim.close()
+        return await task, ticks
+
+    sigs, ticks = asyncio.run(main())
+    assert len(sigs) == 1
+    assert ticks >= 10  # the loop kept going during the 100ms signature
+
+
+def test_cancel_queued_operation(monkeypatch):
+    shim = make_shim(monkeypatch)
+    started, unblock = threading.Event(), threading.Event()
+    signed = []
+
+    def sign(ser, *args, **kwargs):
+        signed.append(ser)
+        started.set()
+        unblock.wait(5)
+        return [ser.hex()]
+
+    shim.shim.sign = sign
+
+    async def main():
+        running = asyncio.ensure_future(shim.sign(ser=b"first"))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        queued = asyncio.ensure_future(shim.sign(ser=b"second"))
+        await asyncio.sleep(0)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        unblock.set()
+        result = await running
+        await shim.close()
+        return result, queued.cancelled()
+
+    result, cancelled = asyncio.run(main())
+    assert result == [b"first".hex()]
+    assert cancelled
+    assert signed == [b"first"]  # withdrawn before it reached the device
+
+
+def test_close_keeps_callers_executor(monkeypatch):
+    with futures.ThreadPoolExecutor(max_workers=1) as executor:
+        shim = make_shim(monkeypatch, executor=executor)
+        asyncio.run(shim.close())
+        assert executor.submit(lambda: 42).result() == 42
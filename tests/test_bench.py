@@ -0,0 +1,319 @@
+"""
+Device round-trip benchmarks for incept/rotate/sign over a fake transport.
+
+Every scenario reports its wall time and the device messages it exchanged,
+and is checked against bench_baseline.json: more round trips than the
+baseline fails the test. Wall times depend on the load of the machine, so
+they are only checked (against a multiple of the baseline) with
+TREZOR_SHIM_BENCH=1. Run with `-s` to print the report; set
+TREZOR_SHIM_BENCH_UPDATE=1 to store new baselines. The util/ scenarios time
+the codec helpers under identity derivation, key decoding and socket
+framing; their slower reference implementations are reported alongside.
+"""
+import io
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import threading
+import time
+
+import nacl.bindings
+import pytest
+
+from trezor_shim.core import keeping
+from trezor_shim.trezor import formats
+from trezor_shim.trezor import ui
+from trezor_shim.trezor import util
+
+from . import fakes
+from . import test_util
+
+LATENCY = {
+    "Initialize": 0.002,
+    "GetAddress": 0.004,
+    "GetPublicKey": 0.002,
+    "SignIdentity": 0.003,
+    "GetECDHSessionKey": 0.002,
+    "Ping": 0.001,
+}
+COUNTS = [1, 2, 4, 8, 16]
+KEYS = [1, 10, 100, 1000]
+SIZES = [64, 1024, 16384]
+CODEC_ROUNDS = 200
+SLACK = 3.0  # tolerated wall time, as a multiple of the baseline
+
+BASELINE = pathlib.Path(__file__).with_name("bench_baseline.json")
+BASELINES = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+UPDATE = bool(os.environ.get("TREZOR_SHIM_BENCH_UPDATE"))
+TIMED = bool(os.environ.get("TREZOR_SHIM_BENCH"))  # also check wall times
+
+# Modules that importing the shim and constructing a TrezorShim must not load.
+LAZY = ["asyncio", "ecdsa", "nacl", "semver", "unidecode", "trezorlib.client", "trezorlib.messages"]
+STARTUP = """
+import sys, time
+start = time.perf_counter()
+from trezor_shim.core import keeping
+imported = time.perf_counter()
+keeping.TrezorShim(pidx=0)
+constructed = time.perf_counter()
+print(imported - start, constructed - imported)
+print(*[name for name in {lazy!r} if name in sys.modules])
+"""
+
+
+@pytest.fixture(scope="module")
+def report():
+    rows = {}
+    yield rows
+    print("\n{:<28} {:>10} {:>10}  {}".format("scenario", "wall ms", "roundtrips", "messages"))
+    for name, row in rows.items():
+        print("{:<28} {:>10.2f} {:>10}  {}".format(name, row["wall"] * 1e3, row["roundtrips"],
+                                                  row["counts"]))
+    if UPDATE:
+        baselines = dict(BASELINES)
+        baselines.update({name: dict(wall=round(row["wall"], 4), roundtrips=row["roundtrips"])
+                          for name, row in rows.items()})
+        BASELINE.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.fixture
+def make_shim(monkeypatch):
+    monkeypatch.setitem(keeping.BACKENDS, "fake", fakes.FakeTrezor)
+
+    def make(**kwargs):
+        transport = fakes.FakeTransport(latency=LATENCY)
+        return keeping.TrezorShim(pidx=0, backend="fake", transport=transport, **kwargs), transport
+
+    return make
+
+
+def measure(report, name, transport, fn):
+    transport.reset()
+    start = time.perf_counter()
+    result = fn()
+    wall = time.perf_counter() - start
+    check(report, name, wall, transport.roundtrips, dict(transport.counts))
+    return result
+
+
+def check(report, name, wall, roundtrips=0, counts=None, reference=False):
+    """Report a scenario, checking it against its baseline unless it is a `reference` one."""
+    report[name] = dict(wall=wall, roundtrips=roundtrips, counts=counts or {})
+
+    baseline = BASELINES.get(name)
+    if baseline is not None and not UPDATE and not reference:
+        assert roundtrips <= baseline["roundtrips"], \
+            f"{name}: {roundtrips} round trips, baseline {baseline['roundtrips']}"
+        if TIMED:
+            assert wall <= baseline["wall"] * SLACK + 0.05, \
+                f"{name}: {wall:.4f}s, baseline {baseline['wall']:.4f}s"
+
+
+def test_startup(report):
+    output = subprocess.run([sys.executable, "-c", STARTUP.format(lazy=LAZY)], check=True,
+                            capture_output=True, text=True).stdout.splitlines()
+    imported, constructed = map(float, output[0].split())
+    assert output[1:] == [""], f"loaded eagerly: {output[1]}"
+    check(report, "startup/import", imported)
+    check(report, "startup/construct", constructed)
+
+
+def test_deferred_pinentry_options(monkeypatch):
+    probes = []
+    monkeypatch.setattr(ui.sys.stdin, "isatty", lambda: True, raising=False)
+    monkeypatch.setattr(ui.subprocess, "check_output", lambda args: probes.append(args) or b"/dev/pts/1")
+    shim = keeping.TrezorShim(pidx=0)
+    assert probes == []  # no prompt shown yet
+    assert shim.ui.options_getter()[0] == b"ttyname=/dev/pts/1"
+    shim.ui.options_getter()
+    assert probes == [["tty"]]
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def test_incept(report, make_shim, count):
+    shim, transport = make_shim(count=count, ncount=count)
+    keys, ndigs = measure(report, f"incept/count={count}", transport, shim.incept)
+    assert len(keys) == len(ndigs) == count
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def test_rotate(report, make_shim, count):
+    shim, transport = make_shim(count=count, ncount=count)
+    shim.incept()
+    keys, ndigs = measure(report, f"rotate/count={count}", transport,
+                          lambda: shim.rotate(count, True))
+    assert len(keys) == len(ndigs) == count
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def test_rotate_prefetched(report, make_shim, count):
+    shim, transport = make_shim(count=count, ncount=count, prefetch=2)
+    expected, _ = make_shim(count=count, ncount=count)
+    assert shim.incept() == expected.incept()
+    for _ in range(2):
+        shim.pending.result()
+        refilled = threading.Event()  # hold the next refill back until measured
+        shim.prefetcher.submit(refilled.wait)
+        result = measure(report, f"rotate/prefetched/count={count}", transport,
+                         lambda: shim.rotate(count, True))
+        refilled.set()
+        assert result == expected.rotate(count, True)
+    shim.close()
+
+
+@pytest.mark.parametrize("count", COUNTS)
+def test_sign(report, make_shim, count):
+    shim, transport = make_shim(count=count, ncount=count)
+    shim.incept()
+    sigs = measure(report, f"sign/count={count}", transport, lambda: shim.sign(ser=bytes(64)))
+    assert len(sigs) == count
+
+
+def ding_all(sigs, indexed, indices, ondices):
+    """Signature encoding building a Siger or Cigar per signature, for reference."""
+    if not indexed:
+        return [keeping.ding(sig, None, index=None, only=False, ondex=None).qb64 for sig in sigs]
+    return [keeping.ding(sig, None, index=i, only=o is None, ondex=o).qb64
+            for sig, i, o in zip(sigs, indices, ondices)]
+
+
+@pytest.mark.parametrize("keys", KEYS)
+@pytest.mark.parametrize("indexed", [True, False])
+def test_encode(report, keys, indexed):
+    sigs = [os.urandom(64) for _ in range(keys)]
+    indices = list(range(keys))
+
+    start = time.perf_counter()
+    expected = ding_all(sigs, indexed, indices, indices)
+    check(report, f"encode/ding/indexed={indexed}/keys={keys}", time.perf_counter() - start,
+          reference=True)
+    start = time.perf_counter()
+    assert keeping.encode(sigs, indexed) == expected
+    check(report, f"encode/batch/indexed={indexed}/keys={keys}", time.perf_counter() - start)
+
+
+def test_encode_indices():
+    sigs = [os.urandom(64) for _ in range(8)]
+    indices = [0, 1, 63, 64, 5, 4095, 7, 200]
+    ondices = [0, None, 2, 64, None, 1, 70, 200]
+    assert keeping.encode(sigs, True, indices, ondices) == ding_all(sigs, True, indices, ondices)
+    with pytest.raises(ValueError):
+        keeping.encode(sigs, True, [-1] * 8)
+    with pytest.raises(ValueError):
+        keeping.encode(sigs, True, indices, [True] * 8)
+    with pytest.raises(Exception) as batch:
+        keeping.encode(sigs[:1], True, [64 ** 4])
+    with pytest.raises(Exception) as reference:
+        keeping.ding(sigs[0], None, index=64 ** 4, only=False, ondex=64 ** 4)
+    assert type(batch.value) is type(reference.value)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_sign_payload(report, make_shim, size):
+    shim, transport = make_shim()
+    sigs = measure(report, f"sign/size={size}", transport, lambda: shim.sign(ser=bytes(size)))
+    assert len(sigs) == 1
+
+
+def test_sign_many(report, make_shim):
+    shim, transport = make_shim(count=2)
+    sers = [bytes([idx]) * 256 for idx in range(32)]
+    results = measure(report, "sign_many/items=32", transport, lambda: shim.sign_many(sers))
+    assert all(len(sigs) == 2 for sigs in results)
+
+
+def test_warm_session(report, make_shim):
+    shim, transport = make_shim(idle_timeout=float("inf"))
+    shim.sign(ser=bytes(64))
+    measure(report, "sign/warm", transport, lambda: shim.sign(ser=bytes(64)))
+    shim.close()
+
+
+def test_expired_session(report, make_shim):
+    shim, transport = make_shim()
+    shim.incept()
+    transport.sessions.clear()  # device dropped the session, e.g. after a power cycle
+    measure(report, "sign/expired_session", transport, lambda: shim.sign(ser=bytes(64)))
+    assert transport.counts["GetAddress"] == 1  # full handshake again
+    transport.reset()
+    shim.sign(ser=bytes(64))
+    assert transport.counts["GetAddress"] == 0
+
+
+def test_ecdh(report, make_shim):
+    shim, transport = make_shim(idle_timeout=float("inf"), ecdh_ttl=60)
+    identity = shim.device._create_identity("peer-0-0")
+    peers = [b"\x40" + nacl.bindings.crypto_scalarmult_base(bytes([idx]) * 32)
+             for idx in range(1, 17)]
+    keys = measure(report, "ecdh_many/peers=16", transport,
+                   lambda: shim.session.call("ecdh_many", identity, peers))
+    assert transport.counts["GetECDHSessionKey"] == 16
+    cached = measure(report, "ecdh_many/cached", transport,
+                     lambda: shim.session.call("ecdh_many", identity, peers))
+    assert cached == keys and transport.roundtrips == 0
+    shim.close()
+
+
+def test_keepalive(report, make_shim):
+    shim, transport = make_shim(keepalive=3600)  # one tick at start, then manual ones
+    deadline = time.monotonic() + 5
+    while not shim.session.connected and time.monotonic() < deadline:
+        time.sleep(0.001)
+    assert shim.session.connected  # pre-warmed before the first operation
+    measure(report, "sign/keepalive", transport, lambda: shim.sign(ser=bytes(64)))
+    assert dict(transport.counts) == {"SignIdentity": 1}
+
+    keepalive = shim.keepalives[0]
+    assert keepalive.tick() == "ping"
+    transport.unplugged = True
+    assert keepalive.tick() == "lost"
+    assert not shim.session.connected
+    assert keepalive.tick() == "absent"
+    transport.unplugged = False
+    transport.sessions.clear()  # replugged devices start a new session
+    assert keepalive.tick() == "connect"
+    measure(report, "sign/replugged", transport, lambda: shim.sign(ser=bytes(64)))
+    assert dict(transport.counts) == {"SignIdentity": 1}
+    shim.close()
+    assert keepalive.thread is None
+
+
+def codec_cases():
+    blob = os.urandom(1024)
+    number = util.bytes2num(blob[:32])
+    msgs = [os.urandom(256) for _ in range(8)]
+    framed = util.frame(*msgs)
+    pubkeys = [b"\x00" + os.urandom(32) for _ in range(100)]
+    return {
+        "crc24": (lambda: util.crc24(blob), lambda: test_util.crc24_bitwise(blob)),
+        "bytes2num": (lambda: util.bytes2num(blob[:32]),
+                      lambda: test_util.bytes2num_bytewise(blob[:32])),
+        "num2bytes": (lambda: util.num2bytes(number, 32),
+                      lambda: test_util.num2bytes_bytewise(number, 32)),
+        "frame": (lambda: util.frame(*msgs), None),
+        "decode_pubkeys": (
+            lambda: formats.decode_pubkeys(pubkeys, formats.CURVE_ED25519),
+            lambda: [bytes(formats.decompress_pubkey(pubkey, formats.CURVE_ED25519))
+                     for pubkey in pubkeys]),
+        "recv": (lambda: util.read_frame(io.BytesIO(framed)),
+                 lambda: util.read_frame(test_util.Chunked(framed))),
+    }
+
+
+@pytest.mark.parametrize("name", sorted(codec_cases()))
+def test_codec(report, name):
+    fast, reference = codec_cases()[name]
+    if reference is not None:
+        assert fast() == reference()
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(CODEC_ROUNDS):
+            fn()
+        return time.perf_counter() - start
+
+    check(report, f"util/{name}", timed(fast))
+    if reference is not None:
+        check(report, f"util/{name}/reference", timed(reference), reference=True)
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+from trezor_shim.trezor import caching
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    evicted = []
+    cache = caching.LRUCache(size=2, on_evict=lambda key, value: evicted.append(key))
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert evicted == ["b"]
+    assert cache.get("b") is None
+    cache.invalidate("a")
+    cache.clear()
+    assert evicted == ["b", "a", "c"]
+    assert cache.stats() == caching.CacheStats(hits=1, misses=1, evictions=1, expirations=0, size=0)
+
+
+def test_ttl_expiry():
+    clock = Clock()
+    cache = caching.TTLCache(ttl=10, timer=clock)
+    cache.put("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.peek("a") is None
+    assert cache.get("a") is None
+    assert cache.stats().expirations == 1
+
+
+def test_expired_entries_purged():
+    clock = Clock()
+    expired = []
+    cache = caching.LRUCache(timer=clock, on_evict=lambda key, value: expired.append(key))
+    cache.put("a", 1, ttl=5)
+    cache.put("b", 2, ttl=10)
+    cache.put("c", 3)
+    clock.now = 5
+    cache.get("c")  # any lookup drops what expired, not only its own key
+    assert expired == ["a"]
+    clock.now = 10
+    cache.put("d", 4)
+    assert expired == ["a", "b"]
+    assert len(cache) == 2 and cache.next_expiry is None
+    assert cache.stats().expirations == 2
+
+
+def test_single_flight_load():
+    cache = caching.LRUCache()
+    calls = []
+    started = threading.Event()
+
+    def loader():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.load("key", loader)))
+               for _ in range(4)]
+    threads[0].start()
+    started.wait()
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["value"] * 4
+    assert calls == [1]
+
+    with pytest.raises(ZeroDivisionError):
+        cache.load("other", lambda: 1 / 0)
+    assert "other" not in cache
+    assert cache.load("other", lambda: 2) == 2
+
+
+def test_memoize_method_per_instance():
+    class Device:
+        def __init__(self, name):
+            self.name = name
+            self.calls = 0
+
+        @caching.memoize_method(size=8)
+        def pubkey(self, key_id):
+            self.calls += 1
+            return (self.name, key_id)
+
+    one, two = Device("one"), Device("two")
+    assert one.pubkey("a") == ("one", "a")
+    assert two.pubkey("a") == ("two", "a")
+    assert one.pubkey("a") == ("one", "a")
+    assert (one.calls, two.calls) == (1, 1)
+    Device.pubkey.cache_of(one).clear()
+    one.pubkey("a")
+    assert one.calls == 2
@@ -0,0 +1,194 @@
+import nacl.bindings
+import pytest
+from keri.core import coring
+
+from trezor_shim.core import keeping
+from trezor_shim.trezor import emulator
+from trezor_shim.trezor import interface
+
+MNEMONIC = "abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about"
+
+
+def pubkey_of(secret):
+    return nacl.bindings.crypto_scalarmult_base(secret)
+
+
+def test_slip10_vectors():
+    seed = bytes.fromhex("000102030405060708090a0b0c0d0e0f")
+
+    secret = emulator.derive(seed, [], "ed25519")
+    assert secret.hex() == "2b4be7f19ee27bbf30c667b642d5f4aa69fd169872f8fc3059c08ebae2eb19e7"
+    assert emulator.public_key(secret, "ed25519").hex() == \
+        "00a4b2856bfec510abab89753fac1ac0e1112364e7d250545963f135f2a33188ed"
+
+    secret = emulator.derive(seed, [emulator.HARDENED], "ed25519")
+    assert emulator.public_key(secret, "ed25519").hex() == \
+        "008c8a13df77a28f3445213a0f432fde644acaa215fc72dcdf300d5efaa85d350c"
+
+    secret = emulator.derive(seed, [], "curve25519")
+    assert emulator.public_key(secret, "curve25519").hex() == \
+        "015c7289dc9f7f3ea1c8c2de7323b9fb0781f69c9ecd6de4f095ac89a02dc80577"
+
+
+def test_soft_trezor():
+    device = emulator.SoftTrezor(mnemonic=MNEMONIC)
+    with device:
+        verkey = device.pubkey(key_id="stem-0-0")
+        sig, signed_by = device.sign_with_pubkey(key_id="stem-0-0", blob=b"abc")
+        assert signed_by == verkey
+        assert coring.Verfer(raw=verkey, code=coring.MtrDex.Ed25519).verify(sig, b"abc")
+
+        # passphrases derive another seed
+        other = emulator.SoftTrezor(mnemonic=MNEMONIC, passphrase="secret")
+        with other:
+            assert other.pubkey(key_id="stem-0-0") != verkey
+            assert other.fingerprint() != device.fingerprint()
+
+        peer = bytes(range(32))
+        identity = device._create_identity("stem-0-0")
+        session_key, pubkey = device.ecdh_with_pubkey(identity, b"\x40" + pubkey_of(peer))
+        assert session_key == b"\x04" + nacl.bindings.crypto_scalarmult(peer, pubkey)
+
+
+def test_ecdh_cache():
+    clock = [0.0]
+    device = emulator.SoftTrezor(mnemonic=MNEMONIC, ecdh_ttl=60)
+    device.ecdh_cache.timer = lambda: clock[0]
+    calls = []
+    derive = device._ecdh_with_pubkey
+    device._ecdh_with_pubkey = lambda *args: calls.append(args) or derive(*args)
+
+    identity = device._create_identity("stem-0-0")
+    peers = [b"\x40" + pubkey_of(bytes([idx]) * 32) for idx in range(1, 4)]
+    with device:
+        keys = device.ecdh_many(identity, peers + peers[:1])
+        assert keys[3] == keys[0] and len(set(keys)) == 3
+        assert len(calls) == 3
+        assert device.ecdh(identity, peers[1]) == keys[1]
+        assert len(calls) == 3  # served from the cache
+
+        stored = [entry[0] for _, entry in device.ecdh_cache.entries.values()]
+        clock[0] = 61.0
+        device.ecdh_cache.put("other", (bytearray(1), None))
+        assert all(key == bytes(len(key)) for key in stored)  # zeroized once expired
+        assert len(device.ecdh_cache) == 1
+        assert device.ecdh(identity, peers[1]) == keys[1]
+        assert len(calls) == 4
+        stored = [entry[0] for _, entry in device.ecdh_cache.entries.values()]
+    assert all(key == bytes(len(key)) for key in stored)  # and once the device is closed
+    assert len(device.ecdh_cache) == 0
+
+    with emulator.SoftTrezor(mnemonic=MNEMONIC) as uncached:
+        assert uncached.ecdh_many(identity, peers) == keys[:3]
+
+
+def test_identity_paths():
+    device = emulator.SoftTrezor(mnemonic=MNEMONIC)
+    for key_id in ["stem-0-0", "stem-0-1", "stëm-3-17"]:
+        parsed = interface.Identity(identity_str="signify://", curve_name="ed25519")
+        parsed.identity_dict["host"] = key_id
+        identity = device._create_identity(key_id)
+        assert identity.items() == parsed.items()
+        assert identity.to_bytes() == parsed.to_bytes()
+        for ecdh in (False, True):
+            assert identity.get_bip32_address(ecdh) == parsed.get_bip32_address(ecdh)
+
+    assert interface.signify_addresses("stëm", 3, 16, 2) == [
+        device._create_identity("stëm-3-{}".format(kidx)).get_bip32_address() for kidx in (16, 17)]
+
+    shim = keeping.TrezorShim(pidx=3, stem="stëm", count=2, backend="emulator", mnemonic=MNEMONIC)
+    shim.incept()
+    before = interface.bip32_address.cache.stats()
+    shim.with_params(pidx=4, stem="stëm", icount=2).sign(ser=b"abc")
+    after = interface.bip32_address.cache.stats()
+    assert after.misses - before.misses == 2  # both paths derived once, for the whole range
+    assert after.hits - before.hits >= 2  # then reused by the device calls
+
+
+def test_emulated_shim():
+    mod = keeping.TrezorShim(pidx=0, count=2, ncount=2, backend="emulator", mnemonic=MNEMONIC)
+    keys, ndigs = mod.incept()
+    assert len(keys) == 2
+    assert len(ndigs) == 2
+
+    ser = b"KERI event"
+    sigs = mod.sign(ser=ser)
+    for key, sig in zip(keys, sigs):
+        assert coring.Verfer(qb64=key).verify(coring.Siger(qb64=sig).raw, ser)
+
+    batch = mod.sign_many([b"one", b"two", b"three"], indexed=False)
+    assert len(batch) == 3
+    assert all(len(cigs) == 2 for cigs in batch)
+    assert mod.sign_many([b"one"]) == [mod.sign(ser=b"one")]
+
+
+def test_threaded_shims_per_seed():
+    def shim(passphrase, **kwargs):
+        return keeping.TrezorShim(pidx=0, backend="emulator", threaded=True, mnemonic=MNEMONIC,
+                                  passphrase=passphrase, **kwargs)
+
+    first, other, same = shim("first"), shim("other"), shim("first")
+    assert other.device is not first.device
+    assert same.device is first.device
+    assert other.incept()[0] != first.incept()[0]
+    assert same.incept()[0] == first.incept()[0]
+
+    with pytest.raises(ValueError):
+        shim("first", idle_timeout=5)
+    first.close()
+    other.close()
+
+
+def test_next_key_digests():
+    mod = keeping.TrezorShim(pidx=5, count=3, ncount=3, backend="emulator", mnemonic=MNEMONIC)
+    _, ndigs = mod.incept()
+    assert ndigs == [coring.Diger(ser=nkey.encode("utf-8"), code=coring.MtrDex.Blake3_256).qb64
+                     for nkey in mod._keys(3, 3, True)]
+
+    hits = keeping._digest.cache.stats().hits
+    keys, _ = mod.rotate(3, True)
+    assert keeping.digest(keys) == ndigs  # rotated in the keys committed to at inception
+    assert keeping._digest.cache.stats().hits == hits + 3
+
+
+def test_rotate_digests():
+    # rotate once passed qb64 str keys to Diger, which only hashes bytes, and raised TypeError
+    mod = keeping.TrezorShim(pidx=7, count=2, ncount=2, backend="emulator", mnemonic=MNEMONIC)
+    mod.incept()
+    keys, ndigs = mod.rotate(2, True)
+    assert keys == mod._keys(2, 2, True)
+    assert ndigs == [coring.Diger(ser=nkey.encode("utf-8"), code=coring.MtrDex.Blake3_256).qb64
+                     for nkey in mod._keys(2, 4, True)]
+
+
+def test_verified_signatures():
+    mod = keeping.TrezorShim(pidx=6, count=3, backend="emulator", mnemonic=MNEMONIC, verify=True)
+    keys, _ = mod.incept()
+    assert mod.sign(ser=b"abc") == keeping.TrezorShim(
+        pidx=6, count=3, backend="emulator", mnemonic=MNEMONIC).sign(ser=b"abc")
+
+    honest = mod.device.sign_with_pubkey
+
+    def faulty(key_id, blob):
+        sig, verkey = honest(key_id, blob)
+        return sig if blob != b"bad" else bytes(64), verkey
+
+    mod.device.sign_with_pubkey = faulty
+    with pytest.raises(interface.DeviceError):
+        mod.sign(ser=b"bad")
+    good, bad = mod.sign_many([b"good", b"bad"])
+    assert len(good) == 3
+    assert isinstance(bad, interface.DeviceError)
+    mod.close()
+
+
+if __name__ == "__main__":
+    test_slip10_vectors()
+    test_soft_trezor()
+    test_ecdh_cache()
+    test_identity_paths()
+    test_emulated_shim()
+    test_threaded_shims_per_seed()
+    test_next_key_digests()
+    test_rotate_digests()
+    test_verified_signatures()
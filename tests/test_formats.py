@@ -0,0 +1,47 @@
+import os
+
+import ecdsa
+import nacl.signing
+import pytest
+
+from trezor_shim.trezor import formats
+
+
+def nist256_keys(count):
+    keys = [ecdsa.SigningKey.generate(curve=ecdsa.NIST256p).get_verifying_key() for _ in range(count)]
+    return [(key.to_string("compressed"), key) for key in keys]
+
+
+def test_decode_ed25519():
+    raw = [bytes(nacl.signing.SigningKey(os.urandom(32)).verify_key) for _ in range(4)]
+    blobs = [b"\x00" + key for key in raw[:2]] + [bytearray(b"\x01" + key) for key in raw[2:]]
+    for blob, key in zip(blobs, raw):
+        assert formats.decode_pubkey(blob, formats.CURVE_ED25519) == key
+        assert bytes(formats.decompress_pubkey(blob, formats.CURVE_ED25519)) == key
+    assert formats.decode_pubkeys(blobs, formats.ECDH_CURVE25519) == raw
+
+    for blob in [b"\x02" + raw[0], raw[0], b"\x00" + raw[0] + b"\x00"]:
+        with pytest.raises(ValueError):
+            formats.decode_pubkey(blob, formats.CURVE_ED25519)
+        with pytest.raises(ValueError):
+            formats.decode_pubkeys([b"\x00" + raw[1], blob], formats.CURVE_ED25519)
+
+
+def test_decode_nist256():
+    keys = nist256_keys(8)
+    for blob, key in keys:
+        assert formats.decode_pubkey(blob, formats.CURVE_NIST256) == key.to_string("uncompressed")
+        assert formats.decompress_pubkey(blob, formats.CURVE_NIST256).to_string() == key.to_string()
+    assert formats.decompress_pubkey(keys[0][0], formats.CURVE_NIST256) is \
+        formats.decompress_pubkey(bytearray(keys[0][0]), formats.CURVE_NIST256)
+    assert formats.decode_pubkeys([blob for blob, _ in keys], formats.CURVE_NIST256) == \
+        [key.to_string("uncompressed") for _, key in keys]
+
+    x = 0
+    while formats._nist256_point(b"\x02" + x.to_bytes(32, "big")) is not None:
+        x += 1  # about half of the x coordinates are on the curve
+    for blob in [b"\x02" + x.to_bytes(32, "big"), b"\x04" + keys[0][0][1:], b"\x03" + b"\xff" * 32]:
+        with pytest.raises(ValueError):
+            formats.decode_pubkey(blob, formats.CURVE_NIST256)
+        with pytest.raises(ValueError):
+            formats.decompress_pubkey(blob, formats.CURVE_NIST256)
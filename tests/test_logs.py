@@ -0,0 +1,87 @@
+import logging
+
+from trezor_shim.core import keeping
+from trezor_shim.trezor import interface
+from trezor_shim.trezor import logs
+from trezor_shim.trezor import metrics
+
+from . import fakes
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def record(msg="signing %s"):
+    return logging.LogRecord("trezor_shim.test", logging.DEBUG, __file__, 1, msg, ("x",), None)
+
+
+def test_payload_and_lazy():
+    assert str(logs.payload(b"abc")) == "<3 bytes ba7816bf8f01>"
+    assert str(logs.payload(None)) == "<none>"
+
+    calls = []
+    value = logs.lazy(lambda: calls.append(1) or "signify://key")
+    assert calls == []
+    assert "%s" % value == "signify://key" and str(value) == "signify://key"
+    assert calls == [1]
+
+
+def test_rate_limit():
+    previous = metrics.registry
+    metrics.set_registry(metrics.Registry())
+    try:
+        clock = Clock()
+        rate_limit = logs.RateLimit(rate=2, timer=clock)
+        assert [rate_limit.filter(record()) for _ in range(4)] == [True, True, False, False]
+        assert rate_limit.filter(record("other %s"))
+        assert rate_limit.filter(logging.makeLogRecord(dict(msg="signing %s", levelno=logging.INFO)))
+
+        clock.now = 0.5
+        kept = record()
+        assert rate_limit.filter(kept)
+        assert kept.getMessage() == "signing x [2 similar suppressed]"
+        assert metrics.registry.value("trezor_shim_log_suppressed_total",
+                                      logger="trezor_shim.test") == 2
+
+        sampled = logs.RateLimit(rate=0, sample=3)
+        assert [sampled.filter(record()) for _ in range(6)] == [True, False, False] * 2
+    finally:
+        metrics.set_registry(previous)
+
+
+def test_rate_limit_opt_in(monkeypatch):
+    monkeypatch.delenv("TREZOR_SHIM_LOG_RATE", raising=False)
+    monkeypatch.delenv("TREZOR_SHIM_LOG_SAMPLE", raising=False)
+    logger = logs.device_logger("trezor_shim.test.unlimited")
+    assert not [f for f in logger.filters if isinstance(f, logs.RateLimit)]
+
+    monkeypatch.setenv("TREZOR_SHIM_LOG_SAMPLE", "4")
+    logger = logs.device_logger("trezor_shim.test.sampled")
+    [rate_limit] = [f for f in logger.filters if isinstance(f, logs.RateLimit)]
+    assert rate_limit.rate is None and rate_limit.sample == 4
+    logger.removeFilter(rate_limit)
+
+
+def test_redacted_device_records(monkeypatch, caplog):
+    monkeypatch.setitem(keeping.BACKENDS, "fake", fakes.FakeTrezor)
+    shim = keeping.TrezorShim(pidx=0, backend="fake", transport=fakes.FakeTransport())
+    event = b'{"v":"KERI10JSON0000fd_","t":"icp","secret":"event body"}'
+
+    formatted = []
+    monkeypatch.setattr(interface.Identity, "to_string",
+                        lambda self: formatted.append(1) or "signify://identity")
+    with caplog.at_level(logging.INFO, logger="trezor_shim"):
+        shim.sign(ser=event)
+    assert formatted == []
+
+    with caplog.at_level(logging.DEBUG, logger="trezor_shim"):
+        shim.sign(ser=event)
+    assert "event body" not in caplog.text
+    assert str(logs.payload(event)) in caplog.text
+    assert formatted
+    shim.close()
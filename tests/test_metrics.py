@@ -0,0 +1,42 @@
+from trezor_shim.trezor import metrics
+
+
+def test_exposition():
+    registry = metrics.Registry(buckets=(0.01, 0.1))
+    registry.inc("trezor_shim_reconnects_total")
+    registry.inc("trezor_shim_key_cache_total", result="hit")
+    registry.inc("trezor_shim_key_cache_total", 2, result="hit")
+    registry.observe("trezor_shim_device_seconds", 0.05, phase="sign_identity")
+    registry.observe("trezor_shim_device_seconds", 0.5, phase="sign_identity")
+
+    assert registry.value("trezor_shim_key_cache_total", result="hit") == 3
+    lines = registry.exposition().splitlines()
+    assert "# TYPE trezor_shim_key_cache_total counter" in lines
+    assert 'trezor_shim_key_cache_total{result="hit"} 3' in lines
+    assert "trezor_shim_reconnects_total 1" in lines
+    assert "# TYPE trezor_shim_device_seconds histogram" in lines
+    assert 'trezor_shim_device_seconds_bucket{phase="sign_identity",le="0.01"} 0' in lines
+    assert 'trezor_shim_device_seconds_bucket{phase="sign_identity",le="0.1"} 1' in lines
+    assert 'trezor_shim_device_seconds_bucket{phase="sign_identity",le="+Inf"} 2' in lines
+    assert 'trezor_shim_device_seconds_count{phase="sign_identity"} 2' in lines
+
+
+def test_pluggable_registry():
+    registry = metrics.Registry()
+    previous = metrics.registry
+    metrics.set_registry(registry)
+    try:
+        with metrics.timer("trezor_shim_operation_seconds", operation="sign"):
+            pass
+        metrics.inc("trezor_shim_failovers_total")
+    finally:
+        metrics.set_registry(previous)
+    assert registry.value("trezor_shim_failovers_total") == 1
+    assert 'trezor_shim_operation_seconds_count{operation="sign"} 1' in registry.exposition()
+
+    metrics.set_registry(metrics.NullRegistry())
+    try:
+        metrics.inc("trezor_shim_failovers_total")
+        assert metrics.exposition() == ""
+    finally:
+        metrics.set_registry(previous)
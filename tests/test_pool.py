@@ -0,0 +1,85 @@
+from concurrent import futures
+
+import pytest
+
+from trezor_shim.trezor import emulator
+from trezor_shim.trezor import interface
+from trezor_shim.trezor import metrics
+from trezor_shim.trezor import pool
+from trezor_shim.trezor import sessions
+
+from . import fakes
+
+WRONG_SEED = emulator.mnemonic_to_seed(fakes.MNEMONIC, "wrong")
+
+
+def make_pool(seeds, latency=None, idle_timeout=0.0):
+    transports = [fakes.FakeTransport(latency=latency, seed=seed, path="fake:{}".format(idx))
+                  for idx, seed in enumerate(seeds)]
+    members = [sessions.Session(fakes.FakeTrezor(path=transport.path, transport=transport),
+                                idle_timeout=idle_timeout)
+               for transport in transports]
+    return pool.Pool(members), transports
+
+
+def test_wrong_seed_excluded():
+    devices, transports = make_pool([WRONG_SEED, None, None])
+    reference = fakes.FakeTrezor(transport=fakes.FakeTransport(path="fake:ref"))
+    with reference:
+        expected = reference.pubkey(key_id="stem-0-0")
+        fingerprint = reference.fingerprint()
+
+    with devices:
+        assert devices.fingerprint == fingerprint
+        assert devices.excluded == [devices.members[0]]
+        assert [devices.call("pubkey", key_id="stem-0-0") for _ in range(4)] == [expected] * 4
+    assert transports[0].counts["GetPublicKey"] == 1  # the probe only
+
+    split, _ = make_pool([WRONG_SEED, None])
+    with split, pytest.raises(interface.DeviceError):
+        split.fingerprint
+
+
+def test_probes_once_per_session():
+    devices, transports = make_pool([None, None, None])
+    with devices:
+        devices.fingerprint
+    for transport in transports:
+        transport.reset()
+
+    with devices:  # reconnects, resuming the sessions the seed was checked in
+        devices.fingerprint
+        devices.call("sign", key_id="stem-0-0", blob=b"abc")
+    assert sum(transport.counts["GetPublicKey"] for transport in transports) == 0
+    assert sum(transport.counts["GetAddress"] for transport in transports) == 0
+    assert sum(transport.counts["SignIdentity"] for transport in transports) == 1
+
+
+def test_failover():
+    previous = metrics.registry
+    metrics.set_registry(metrics.Registry())
+    try:
+        devices, transports = make_pool([None, None], idle_timeout=float("inf"))
+        with devices:
+            devices.fingerprint
+            transports[0].unplugged = True
+            sig = devices.call("sign", key_id="stem-0-0", blob=b"abc")
+            assert len(sig) == 64
+            assert transports[1].counts["SignIdentity"] == 1
+        assert metrics.registry.value("trezor_shim_failovers_total") == 1
+        devices.close()
+    finally:
+        metrics.set_registry(previous)
+
+
+def test_load_spreading():
+    devices, transports = make_pool([None, None, None], latency={"SignIdentity": 0.01},
+                                    idle_timeout=float("inf"))
+    with devices:
+        devices.fingerprint
+        with futures.ThreadPoolExecutor(max_workers=6) as executor:
+            sigs = list(executor.map(lambda idx: devices.call("sign", key_id="stem-0-0",
+                                                              blob=bytes([idx])), range(12)))
+    assert len(set(sigs)) == 12
+    assert all(transport.counts["SignIdentity"] >= 2 for transport in transports)
+    devices.close()
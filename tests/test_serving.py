@@ -0,0 +1,95 @@
+import json
+import socket
+import threading
+from concurrent import futures
+
+import pytest
+from keri.core import coring
+
+from trezor_shim.core import keeping
+from trezor_shim.core import serving
+from trezor_shim.trezor import interface
+from trezor_shim.trezor import util
+
+MNEMONIC = "abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon abandon about"
+
+
+@pytest.fixture(scope="module")
+def daemon(tmp_path_factory):
+    daemon = serving.Daemon(backend="emulator", mnemonic=MNEMONIC)
+    server = daemon.bind(str(tmp_path_factory.mktemp("serve") / "serve.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+    daemon.close()
+
+
+def test_proxy_matches_shim(daemon):
+    proxy = keeping.Module().shim(pidx=1, count=2, ncount=2, daemon=daemon)
+    local = keeping.TrezorShim(pidx=1, count=2, ncount=2, backend="emulator", mnemonic=MNEMONIC)
+
+    assert proxy.incept() == local.incept()
+    assert proxy.rotate(3, True) == local.rotate(3, True)
+    assert proxy.params() == local.params()
+    assert proxy.pubkey(kidx=0) == local.pubkey(kidx=0)
+
+    ser = b"KERI event"
+    assert proxy.sign(ser=ser) == local.sign(ser=ser)
+    assert proxy.sign(ser=ser, indexed=False) == local.sign(ser=ser, indexed=False)
+    assert proxy.sign_many([b"one", b"two"]) == local.sign_many([b"one", b"two"])
+    proxy.close()
+
+
+def test_pipelined_clients(daemon):
+    proxy = serving.ProxyShim(pidx=2, daemon=daemon)
+    sers = [bytes([idx]) * 64 for idx in range(32)]
+    with futures.ThreadPoolExecutor(max_workers=8) as executor:
+        sigs = list(executor.map(lambda ser: proxy.sign(ser=ser), sers))
+    verfer = coring.Verfer(qb64=proxy.pubkey(kidx=0))
+    assert all(verfer.verify(coring.Siger(qb64=sig[0]).raw, ser) for sig, ser in zip(sigs, sers))
+    proxy.close()
+
+
+def test_errors(daemon, tmp_path):
+    proxy = serving.ProxyShim(pidx=0, daemon=daemon)
+    with pytest.raises(ValueError):
+        proxy.call("format_disk")
+    with pytest.raises(ValueError):
+        proxy.sign(ser=b"abc", indices=[-1])
+    proxy.close()
+
+    with pytest.raises(interface.NotFoundError):
+        serving.ProxyShim(pidx=0, daemon=str(tmp_path / "missing.sock")).incept()
+
+
+def exchange(conn, frame):
+    util.send_frame(conn, frame)
+    return json.loads(util.read_frame(conn))
+
+
+def test_malformed_requests(daemon):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(daemon)
+        assert exchange(conn, b"{not json")["error"]["type"] == "JSONDecodeError"
+        assert exchange(conn, b"[1, 2]")["error"]["type"] == "ValueError"
+        response = exchange(conn, json.dumps(dict(id=7, op="pubkey", params={"pidx": 0},
+                                                  args={"kidx": 0})).encode())
+        assert response["id"] == 7 and "result" in response  # the connection survived
+
+
+def test_closed_daemon(tmp_path):
+    closed = serving.Daemon(backend="emulator", mnemonic=MNEMONIC)
+    server = closed.bind(str(tmp_path / "serve.sock"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    closed.close()
+    with pytest.raises(interface.DeviceError, match="daemon closed"):
+        serving.ProxyShim(pidx=0, daemon=server.server_address).incept()
+    server.shutdown()
+    server.server_close()
+
+
+def test_daemon_of_another_user(daemon, monkeypatch):
+    monkeypatch.setattr(util, "same_user", lambda conn: False)
+    with pytest.raises(interface.NotFoundError, match="another user"):
+        serving.ProxyShim(pidx=0, daemon=daemon).incept()
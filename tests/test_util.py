@@ -0,0 +1,94 @@
+import io
+import os
+import random
+import socket
+import struct
+import threading
+
+import pytest
+
+from trezor_shim.trezor import util
+
+
+def crc24_bitwise(blob):
+    crc = 0x0B704CE
+    for octet in bytearray(blob):
+        crc ^= (octet << 16)
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1864CFB
+    return struct.pack('>L', crc)[1:]
+
+
+def bytes2num_bytewise(s):
+    res = 0
+    for i, c in enumerate(reversed(bytearray(s))):
+        res += c << (i * 8)
+    return res
+
+
+def num2bytes_bytewise(value, size):
+    res = []
+    for _ in range(size):
+        res.append(value & 0xFF)
+        value = value >> 8
+    assert value == 0
+    return bytes(bytearray(list(reversed(res))))
+
+
+BLOBS = [b"", b"\x00", b"\xff" * 3, b"KERI", bytearray(b"hello"), os.urandom(1000)]
+
+
+def test_crc24():
+    assert util.crc24(b"") == b"\xb7\x04\xce"
+    for blob in BLOBS + [bytes([octet]) for octet in range(256)]:
+        assert util.crc24(blob) == crc24_bitwise(blob)
+
+
+def test_num_conversions():
+    rng = random.Random(0)
+    for size in [0, 1, 2, 4, 8, 32, 33, 65]:
+        for _ in range(20):
+            value = rng.getrandbits(size * 8)
+            blob = util.num2bytes(value, size)
+            assert blob == num2bytes_bytewise(value, size)
+            assert util.bytes2num(blob) == bytes2num_bytewise(blob) == value
+    assert util.bytes2num(bytearray(b"\x01\x00")) == 256
+    for value, size in [(256, 1), (1, 0), (-1, 4)]:
+        with pytest.raises(AssertionError):
+            num2bytes_bytewise(value, size)
+        with pytest.raises(AssertionError):
+            util.num2bytes(value, size)
+
+
+class Chunked:
+    """Stream returning at most 3 bytes per read, without readinto()."""
+
+    def __init__(self, blob):
+        self.stream = io.BytesIO(blob)
+
+    def read(self, size):
+        return self.stream.read(min(size, 3))
+
+
+def test_recv_and_frames():
+    msgs = [b"abc", bytearray(b"de"), b"", os.urandom(100)]
+    blob = util.frame(*msgs)
+    assert blob == struct.pack(">L", 105) + b"".join(msgs)
+    assert util.frame() == b"\x00\x00\x00\x00"
+
+    for conn in [io.BytesIO(blob), Chunked(blob)]:
+        assert util.recv(conn, ">L") == (105,)
+        assert util.recv(conn, 105) == b"".join(msgs)
+        with pytest.raises(EOFError):
+            util.recv(conn, 1)
+
+    left, right = socket.socketpair()
+    with left, right:
+        sender = threading.Thread(target=lambda: [util.send_frame(left, *msgs),
+                                                  util.send_frame(left, b"x" * 300000)])
+        sender.start()  # the second frame is larger than the socket buffer
+        assert util.read_frame(right) == b"".join(msgs)
+        assert util.read_frame(right) == b"x" * 300000
+        sender.join()